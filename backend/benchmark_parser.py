@@ -0,0 +1,98 @@
+#!/usr/bin/env python3
+# -*- coding: utf-8 -*-
+"""
+测试用例解析性能基准脚本
+使用合成的模型输出（10、1千、1万条用例）测量Markdown解析吞吐量（用例/秒），
+用于发现解析性能回退
+"""
+
+import argparse
+import sys
+import time
+
+from services.test_case_parser import StreamingTestCaseParser, parse_test_cases
+
+CORPUS_SIZES = [10, 1000, 10000]
+
+
+def build_synthetic_output(case_count: int, steps_per_case: int = 4) -> str:
+    """生成与模型输出格式一致的合成Markdown文本"""
+    lines = ["# 正在生成测试用例...", ""]
+    for i in range(1, case_count + 1):
+        lines.append(f"## TC-{i:03d}: 合成测试用例标题 {i}")
+        lines.append("")
+        lines.append("**优先级:** 高")
+        lines.append(f"**描述:** 验证第{i}个功能点在正常与异常输入下的行为")
+        lines.append("**前置条件:** 用户已登录系统")
+        lines.append("")
+        lines.append("### 测试步骤")
+        lines.append("")
+        lines.append("| # | 步骤描述 | 预期结果 |")
+        lines.append("| --- | --- | --- |")
+        for step in range(1, steps_per_case + 1):
+            lines.append(f"| {step} | 执行第{step}步操作并输入测试数据 | 系统正确响应第{step}步操作 |")
+        lines.append("")
+        lines.append("---")
+        lines.append("")
+    return "\n".join(lines)
+
+
+def benchmark_full_parse(markdown_text: str, case_count: int, repeat: int) -> float:
+    """测量一次性解析的吞吐量，取多次运行中的最佳值"""
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        test_cases = parse_test_cases(markdown_text)
+        best = min(best, time.perf_counter() - start)
+        if len(test_cases) != case_count:
+            raise AssertionError(f"解析结果数量不符: 期望 {case_count}，实际 {len(test_cases)}")
+    return case_count / best
+
+
+def benchmark_streaming_parse(markdown_text: str, case_count: int, repeat: int, chunk_size: int = 16) -> float:
+    """测量按流式小块输入时的吞吐量，模拟模型逐块输出"""
+    chunks = [markdown_text[i:i + chunk_size] for i in range(0, len(markdown_text), chunk_size)]
+    best = float("inf")
+    for _ in range(repeat):
+        parser = StreamingTestCaseParser()
+        start = time.perf_counter()
+        for chunk in chunks:
+            parser.feed(chunk)
+        parser.close()
+        best = min(best, time.perf_counter() - start)
+        if len(parser.test_cases) != case_count:
+            raise AssertionError(f"解析结果数量不符: 期望 {case_count}，实际 {len(parser.test_cases)}")
+    return case_count / best
+
+
+def main() -> int:
+    """主函数"""
+    arg_parser = argparse.ArgumentParser(description="测试用例解析性能基准")
+    arg_parser.add_argument("--repeat", type=int, default=3, help="每个规模的重复次数")
+    arg_parser.add_argument("--min-throughput", type=float, default=0.0,
+                            help="最低可接受吞吐量（用例/秒），低于该值时以非零状态退出")
+    args = arg_parser.parse_args()
+
+    print("=" * 60)
+    print(f"{'用例数':>8} {'文本大小(KB)':>14} {'整体解析(用例/秒)':>20} {'流式解析(用例/秒)':>20}")
+    print("=" * 60)
+
+    slowest = float("inf")
+    for case_count in CORPUS_SIZES:
+        markdown_text = build_synthetic_output(case_count)
+        full = benchmark_full_parse(markdown_text, case_count, args.repeat)
+        streaming = benchmark_streaming_parse(markdown_text, case_count, args.repeat)
+        slowest = min(slowest, full, streaming)
+        size_kb = len(markdown_text.encode("utf-8")) / 1024
+        print(f"{case_count:>8} {size_kb:>14.1f} {full:>20.0f} {streaming:>20.0f}")
+
+    if slowest < args.min_throughput:
+        print(f"\n❌ 最低吞吐量 {slowest:.0f} 用例/秒 低于阈值 {args.min_throughput:.0f}")
+        return 1
+
+    print(f"\n✅ 最低吞吐量 {slowest:.0f} 用例/秒")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
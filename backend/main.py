@@ -1,14 +1,19 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
 import uvicorn
 import os
 from dotenv import load_dotenv
 
+# 加载环境变量，需在导入读取配置的模块之前完成
+load_dotenv()
+
 from routers import test_cases
 from services.ai_service import AIService
-
-# 加载环境变量
-load_dotenv()
+from services.export_executor import export_executor
+from services.export_jobs import export_job_manager
+from services.janitor import file_janitor
+from utils.llms import model_client_manager
 
 # 如果上传目录不存在，则创建
 os.makedirs("uploads", exist_ok=True)
@@ -19,10 +24,28 @@ feishu_app_id = os.getenv("FEISHU_APP_ID")
 feishu_app_secret = os.getenv("FEISHU_APP_SECRET")
 ai_service = AIService(feishu_app_id=feishu_app_id, feishu_app_secret=feishu_app_secret)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # 创建共享的模型客户端和连接池
+    model_client_manager.start()
+    export_job_manager.recover()
+    # 加载Token预估使用的分词表（可选，未配置时按字符估算）
+    await ai_service.token_budget.estimator.load()
+    # 定期清理uploads和results目录
+    file_janitor.start()
+    yield
+    # 应用关闭时释放共享的HTTP连接池、导出进程池等资源
+    await file_janitor.stop()
+    await ai_service.aclose()
+    await model_client_manager.aclose()
+    await export_job_manager.shutdown()
+    export_executor.shutdown()
+
 app = FastAPI(
     title="Test Case Generator",
     description="Generate test cases from flowcharts, mind maps, and UI screenshots",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
 # 配置跨域资源共享(CORS)
@@ -48,5 +71,15 @@ async def root():
 async def ping():
     return {"status": "success", "message": "pong"}
 
+@app.get("/api/llm/stats")
+async def llm_stats():
+    """模型调用的并发、排队和等待时间指标"""
+    return ai_service.llm_scheduler.stats()
+
+@app.get("/api/janitor/stats")
+async def janitor_stats():
+    """磁盘清理任务的累计指标"""
+    return file_janitor.stats()
+
 if __name__ == "__main__":
     uvicorn.run("main:app", host="0.0.0.0", port=8000, reload=True)
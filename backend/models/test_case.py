@@ -1,4 +1,4 @@
-from pydantic import BaseModel
+from pydantic import BaseModel, create_model
 from typing import List, Optional
 from datetime import datetime
 from enum import Enum
@@ -52,6 +52,21 @@ class TestCase(BaseModel):
             }
         }
 
+# 模型结构化输出的单个测试用例，由 TestCase 派生，不含由服务端填写的创建时间；
+# 结构化输出要求每个字段都必须出现，可选字段以null表示
+GeneratedTestCase = create_model(
+    "GeneratedTestCase",
+    **{
+        name: (field.annotation, ...)
+        for name, field in TestCase.model_fields.items()
+        if name != "created_at"
+    }
+)
+
+class GeneratedTestCases(BaseModel):
+    """模型结构化输出的JSON Schema"""
+    test_cases: List[GeneratedTestCase]
+
 class TestCaseRequest(BaseModel):
     context: str
     requirements: str
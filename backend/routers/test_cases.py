@@ -9,6 +9,13 @@ import asyncio
 
 from models.test_case import TestCase, TestCaseRequest, TestCaseResponse
 from services.excel_service import excel_service
+from services.export_executor import export_executor, ExportQueueFullError
+from services.export_jobs import export_job_manager
+from services.stream_export_service import stream_export_service
+from services.result_store import result_store
+from services.dedupe_service import TestCaseDeduplicator
+from services.image_preprocessor import IMAGE_SPILL_BYTES
+from utils.file_utils import read_upload, UploadBudget, UploadTooLargeError
 
 router = APIRouter(
     prefix="/api/test-cases",
@@ -19,6 +26,69 @@ router = APIRouter(
 # 如果上传目录不存在，则创建
 os.makedirs("uploads", exist_ok=True)
 
+# 上传大小限制
+MAX_UPLOAD_FILE_BYTES = int(os.getenv("UPLOAD_MAX_FILE_MB", "20")) * 1024 * 1024
+MAX_UPLOAD_REQUEST_BYTES = int(os.getenv("UPLOAD_MAX_REQUEST_MB", "100")) * 1024 * 1024
+
+GENERATION_MODES = ("auto", "single", "sectioned")
+OUTPUT_FORMATS = ("markdown", "json")
+
+def _client_owner(request: Request) -> Optional[str]:
+    """以客户端地址标识请求方，用于导出文件归属和模型调用的公平排队"""
+    return request.client.host if request.client else None
+
+async def _read_uploaded_images(images: List[UploadFile]) -> List[Union[bytes, str]]:
+    """
+    并发读取上传的图片，按上传顺序返回图片字节，超过内存阈值的图片写入uploads目录并返回文件路径
+
+    超过单文件或单次请求大小限制时返回413，并清理已写入的文件
+    """
+    uploads = [image for image in images if image.filename]
+
+    # 已知文件大小时先行检查，避免无谓的写盘
+    total_size = 0
+    for image in uploads:
+        if image.size is not None:
+            if image.size > MAX_UPLOAD_FILE_BYTES:
+                raise HTTPException(
+                    status_code=413,
+                    detail=f"图片 {image.filename} 超过单文件大小限制 {MAX_UPLOAD_FILE_BYTES // (1024 * 1024)}MB"
+                )
+            total_size += image.size
+    if total_size > MAX_UPLOAD_REQUEST_BYTES:
+        raise HTTPException(
+            status_code=413,
+            detail=f"上传图片总大小超过限制 {MAX_UPLOAD_REQUEST_BYTES // (1024 * 1024)}MB"
+        )
+
+    budget = UploadBudget(MAX_UPLOAD_REQUEST_BYTES)
+    results = await asyncio.gather(
+        *[
+            read_upload(
+                image,
+                "uploads",
+                f"{uuid.uuid4()}{os.path.splitext(image.filename)[1]}",
+                MAX_UPLOAD_FILE_BYTES,
+                IMAGE_SPILL_BYTES,
+                budget
+            )
+            for image in uploads
+        ],
+        return_exceptions=True
+    )
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    if errors:
+        for result in results:
+            if isinstance(result, str) and os.path.exists(result):
+                os.remove(result)
+        too_large = next((error for error in errors if isinstance(error, UploadTooLargeError)), None)
+        if too_large is not None:
+            raise HTTPException(status_code=413, detail=str(too_large))
+        raise errors[0]
+
+    return results
+
 @router.post("/generate")
 async def generate_test_cases(
     request: Request,
@@ -26,22 +96,37 @@ async def generate_test_cases(
     images: List[UploadFile] = File(default=[]),
     feishu_url: str = Form(None),
     context: str = Form(...),
-    requirements: str = Form(...)
+    requirements: str = Form(...),
+    generation_mode: str = Form("auto"),
+    output_format: str = Form(None)
 ):
     """
     支持两种输入模式：
     1. PRD输入（文本+多图片）：prd_text + images
     2. 飞书文档输入：feishu_url
+
+    generation_mode: auto（长PRD自动按章节并发生成）、single（整体生成）或 sectioned（按章节生成）
+    output_format: markdown（模型直接输出Markdown）或 json（结构化输出，服务端渲染Markdown），默认取服务端配置
     """
+    if generation_mode not in GENERATION_MODES:
+        raise HTTPException(status_code=400, detail=f"Unsupported generation mode: {generation_mode}")
+    if output_format is not None and output_format not in OUTPUT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported output format: {output_format}")
     ai_service = request.app.state.ai_service
-    image_paths = []
+    # 模型调用排队已满时直接拒绝，避免请求长时间挂起
+    if ai_service.llm_scheduler.is_saturated():
+        raise HTTPException(status_code=429, detail="模型调用繁忙，请稍后重试", headers={"Retry-After": "10"})
+    client_id = _client_owner(request)
     if feishu_url:
         # 飞书文档模式
         return StreamingResponse(
             ai_service.generate_test_cases_stream_from_feishu(
                 feishu_url=feishu_url,
                 context=context,
-                requirements=requirements
+                requirements=requirements,
+                client_id=client_id,
+                generation_mode=generation_mode,
+                output_format=output_format
             ),
             media_type="text/markdown"
         )
@@ -49,50 +134,176 @@ async def generate_test_cases(
         # PRD模式，允许文本、图片任意组合
         if not prd_text and not images:
             raise HTTPException(status_code=400, detail="请提供PRD文本或图片")
-        for image in images:
-            if image.filename:
-                image_id = str(uuid.uuid4())
-                image_extension = os.path.splitext(image.filename)[1]
-                image_path = f"uploads/{image_id}{image_extension}"
-                with open(image_path, "wb") as image_file:
-                    image_file.write(await image.read())
-                image_paths.append(image_path)
+        prd_images = await _read_uploaded_images(images)
         return StreamingResponse(
             ai_service.generate_test_cases_from_multimodal_prd_stream(
                 prd_text=prd_text or "",
-                prd_images=image_paths,
+                prd_images=prd_images,
                 context=context,
-                requirements=requirements
+                requirements=requirements,
+                client_id=client_id,
+                generation_mode=generation_mode,
+                output_format=output_format
             ),
             media_type="text/markdown"
         )
     else:
         raise HTTPException(status_code=400, detail="请提供有效的输入")
 
-@router.post("/export")
-async def export_test_cases(test_cases: List[Union[TestCase, Dict[str, Any]]]):
+@router.post("/dedupe")
+async def dedupe_test_cases(test_cases: List[Union[TestCase, Dict[str, Any]]], threshold: Optional[float] = None):
+    """
+    合并近似重复的测试用例
+
+    threshold: 标题和步骤文本的Jaccard相似度阈值（0~1），默认取服务端配置
+    """
+    if threshold is not None and not 0 < threshold <= 1:
+        raise HTTPException(status_code=400, detail="threshold must be in (0, 1]")
+    cases = [tc if isinstance(tc, dict) else tc.model_dump(mode="json") for tc in test_cases]
+    deduplicator = TestCaseDeduplicator(threshold=threshold)
+    kept, merged = await asyncio.to_thread(deduplicator.deduplicate, cases)
+    return {
+        "test_cases": kept,
+        "merged": merged,
+        "removed_count": len(cases) - len(kept),
+    }
+
+EXCEL_MEDIA_TYPE = "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+
+async def _build_excel(test_cases: List[Union[TestCase, Dict[str, Any]]], owner: str = None, generation_id: str = None) -> str:
+    """在独立的导出进程池中生成Excel文件，不阻塞事件循环，并登记到结果索引"""
+    excel_path = await export_executor.run(excel_service.generate_excel, test_cases)
+    result_store.register(excel_path, owner=owner, generation_id=generation_id, case_count=len(test_cases))
+    return excel_path
+
+async def _export_excel_response(
+    test_cases: List[Union[TestCase, Dict[str, Any]]],
+    owner: str = None,
+    generation_id: str = None
+) -> FileResponse:
+    """在导出执行器中生成Excel文件并返回下载响应，队列已满时返回429"""
     try:
-        # 生成Excel文件
-        excel_path = excel_service.generate_excel(test_cases)
+        excel_path = await _build_excel(test_cases, owner, generation_id)
 
         # 返回文件供下载
         return FileResponse(
             path=excel_path,
             filename=os.path.basename(excel_path),
-            media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+            media_type=EXCEL_MEDIA_TYPE
         )
+    except ExportQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Error exporting test cases: {str(e)}")
 
+# 支持的导出格式，zip为多种格式的打包
+EXPORT_FORMATS = ("xlsx", "csv", "jsonl", "zip")
+ZIP_FORMATS = ("xlsx", "csv", "jsonl")
+
+def _parse_zip_formats(formats: Optional[str]) -> List[str]:
+    """解析zip打包的格式列表，默认打包全部格式"""
+    if not formats:
+        return list(ZIP_FORMATS)
+    selected = []
+    for item in formats.split(","):
+        item = item.strip().lower()
+        if item not in ZIP_FORMATS:
+            raise HTTPException(status_code=400, detail=f"Unsupported bundle format: {item}")
+        if item not in selected:
+            selected.append(item)
+    return selected
+
+async def _export_response(
+    test_cases: List[Union[TestCase, Dict[str, Any]]],
+    format: str = "xlsx",
+    formats: Optional[str] = None,
+    owner: str = None,
+    generation_id: str = None
+):
+    """
+    按格式返回导出响应
+
+    xlsx在导出执行器中生成文件；csv和jsonl逐行流式输出，不落盘；
+    zip将formats指定的格式边压缩边输出
+    """
+    format = format.lower()
+    if format not in EXPORT_FORMATS:
+        raise HTTPException(status_code=400, detail=f"Unsupported export format: {format}")
+    if format == "xlsx":
+        return await _export_excel_response(test_cases, owner, generation_id)
+
+    filename_prefix = f"test_cases_{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+    if format == "csv":
+        content = stream_export_service.iter_csv(test_cases)
+    elif format == "jsonl":
+        content = stream_export_service.iter_jsonl(test_cases)
+    else:
+        bundle_formats = _parse_zip_formats(formats)
+        excel_path = None
+        if "xlsx" in bundle_formats:
+            try:
+                excel_path = await _build_excel(test_cases, owner, generation_id)
+            except ExportQueueFullError as e:
+                raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+        content = stream_export_service.iter_zip(test_cases, bundle_formats, filename_prefix, excel_path)
+
+    return StreamingResponse(
+        content,
+        media_type=stream_export_service.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename_prefix}.{format}"'}
+    )
+
+@router.post("/export")
+async def export_test_cases(
+    request: Request,
+    test_cases: List[Union[TestCase, Dict[str, Any]]],
+    format: str = "xlsx",
+    formats: Optional[str] = None
+):
+    """导出测试用例，format可选 xlsx、csv、jsonl、zip，zip时formats指定打包的格式（逗号分隔）"""
+    return await _export_response(test_cases, format, formats, owner=_client_owner(request))
+
+@router.post("/export/jobs", status_code=202)
+async def create_export_job(request: Request, test_cases: List[Union[TestCase, Dict[str, Any]]]):
+    """提交后台导出任务，立即返回任务ID，完成后通过下载接口获取文件"""
+    try:
+        job = await export_job_manager.submit(test_cases, owner=_client_owner(request))
+    except ExportQueueFullError as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    return job
+
+@router.get("/export/jobs/{job_id}")
+async def get_export_job(job_id: str):
+    """查询导出任务状态，完成后返回下载地址"""
+    job = export_job_manager.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    if job["status"] == export_job_manager.STATUS_COMPLETED:
+        job["download_url"] = f"{router.prefix}/download/{job['filename']}"
+    return job
+
+@router.get("/export/metrics")
+async def export_metrics():
+    """导出队列的排队等待时间、生成耗时等指标，以及结果目录的占用情况"""
+    return {**export_executor.stats(), "results": result_store.stats()}
+
+@router.get("/export/{generation_id}")
+async def export_generation(request: Request, generation_id: str, format: str = "xlsx", formats: Optional[str] = None):
+    """直接导出服务端暂存的某次生成结果，无需回传用例数据"""
+    test_cases = request.app.state.ai_service.generation_store.get(generation_id)
+    if test_cases is None:
+        raise HTTPException(status_code=404, detail="Generation not found or expired")
+    return await _export_response(test_cases, format, formats, owner=_client_owner(request), generation_id=generation_id)
+
 @router.get("/download/{filename}")
 async def download_excel(filename: str):
-    file_path = f"results/{filename}"
-
-    if not os.path.exists(file_path):
+    # 只提供结果索引中登记过的文件
+    result = result_store.get(filename)
+    if result is None:
         raise HTTPException(status_code=404, detail="File not found")
 
     return FileResponse(
-        path=file_path,
+        path=result["path"],
         filename=filename,
-        media_type="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet"
+        media_type=result["media_type"]
     )
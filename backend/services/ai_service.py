@@ -1,111 +1,515 @@
+import asyncio
 import json
 import os
-from typing import List, Dict, Any, AsyncGenerator
+import re
+from typing import List, Dict, Any, AsyncGenerator, Optional, Tuple, Union
 from dotenv import load_dotenv
 
+import httpx
+import openai
+
 from autogen_agentchat.agents import AssistantAgent
 from autogen_agentchat.base import TaskResult
 from autogen_agentchat.messages import ModelClientStreamingChunkEvent, MultiModalMessage as AGMultiModalMessage, StructuredMessage
-from autogen_core import Image as AGImage
-from PIL import Image as PILImage
+from autogen_core.models import CreateResult, SystemMessage, UserMessage
 
-from utils.llms import model_client
-from models.test_case import TestCase, TestCaseResponse
+from utils.llms import model_client_manager, ModelClientManager, MODEL_NAME
+from models.test_case import TestCase, TestCaseResponse, GeneratedTestCases
 from .feishu_service import FeishuService
+from .generation_cache import GenerationCache
+from .generation_store import GenerationStore
+from .image_preprocessor import ImagePreprocessor
+from .llm_scheduler import LLMScheduler
+from .prd_splitter import PRDSection, split_prd_sections, document_outline
+from .dedupe_service import TestCaseDeduplicator, format_merge_report
+from .token_budget import TokenBudget, BudgetPlan
+from .generation_checkpoint import GenerationCheckpoint, CHECKPOINT_MARKER, RESUME_MARKER
+from .test_case_parser import StreamingTestCaseParser, StreamingJSONCaseParser, parse_test_cases
 from .prompts import TestCasePrompts, SystemMessages, ErrorMessages
 
 
 class AIService:
-    def __init__(self, feishu_app_id: str = None, feishu_app_secret: str = None):
+    def __init__(self, feishu_app_id: str = None, feishu_app_secret: str = None, model_clients: ModelClientManager = None):
         # 初始化飞书服务（如果提供了凭证）
         if feishu_app_id and feishu_app_secret:
             self.feishu_service = FeishuService(feishu_app_id, feishu_app_secret)
         else:
             self.feishu_service = None
 
+        # 生成结果缓存，相同输入直接回放已生成的内容
+        self.generation_cache = GenerationCache()
+
+        # 发送给视觉模型前的图片预处理
+        self.image_preprocessor = ImagePreprocessor()
+
+        # 按生成ID暂存解析出的测试用例，供导出直接使用
+        self.generation_store = GenerationStore()
+
+        # 共享的模型客户端由应用生命周期创建和关闭
+        self.model_clients = model_clients or model_client_manager
+
+        # 模型调用的并发上限、按客户端公平排队和RPM/TPM限速
+        self.llm_scheduler = LLMScheduler()
+        # 发送前按文本分词和图片分辨率预估输入Token，超出预算时调整请求；模型输出按固定值预估
+        self.token_budget = TokenBudget(default_image_edge=self.image_preprocessor.max_edge)
+        self.output_token_estimate = int(os.getenv("LLM_OUTPUT_TOKEN_ESTIMATE", "4000"))
+
+        # 长PRD按章节拆分并发生成：自动启用的文本长度阈值和同时生成的章节数
+        self.sectioned_threshold_chars = int(os.getenv("PRD_SECTIONED_THRESHOLD_CHARS", "15000"))
+        self.section_concurrency = int(os.getenv("PRD_SECTION_CONCURRENCY", "3"))
+
+        # 模型输出格式：markdown 直接输出Markdown，json 使用结构化输出后在服务端渲染Markdown
+        self.default_output_format = os.getenv("GENERATION_OUTPUT_FORMAT", "markdown")
+
+        # 上游中断时从最后一个完整用例处续写的最大次数和退避秒数，为0时不续写、逐块直接输出
+        self.max_resumes = int(os.getenv("GENERATION_MAX_RESUMES", "2"))
+        self.resume_backoff = float(os.getenv("GENERATION_RESUME_BACKOFF", "2"))
+
+        # 生成结束时检查近似重复的测试用例：report 只提示疑似重复并保留全部用例，merge 删除重复用例，off 不检查
+        self.deduplicator = TestCaseDeduplicator()
+        self.dedupe_mode = os.getenv("DEDUPE_MODE", "report").lower()
+
+        # 智能体模板参数，每个请求只需创建轻量的智能体实例承载各自的对话状态
+        self._agent_template = {
+            "name": "agent",
+            "system_message": SystemMessages.MULTIMODAL_ANALYSIS,
+            "model_client_stream": True,
+        }
+
+    def _create_agent(self) -> AssistantAgent:
+        """基于模板和共享的模型客户端创建单次请求使用的智能体"""
+        return AssistantAgent(model_client=self.model_clients.client, **self._agent_template)
+
+    async def aclose(self) -> None:
+        """释放服务持有的连接池、进程池和缓存等资源"""
+        if self.feishu_service:
+            await self.feishu_service.aclose()
+        self.image_preprocessor.shutdown()
+        self.generation_cache.close()
+
     async def generate_test_cases_from_multimodal_prd_stream(
         self,
         prd_text: str,
-        prd_images: List[str],  # 改为接收文件路径列表
+        prd_images: List[Union[bytes, str]],  # 图片字节或落盘后的文件路径
         context: str,
-        requirements: str
+        requirements: str,
+        client_id: str = None,
+        generation_mode: str = "auto",
+        output_format: str = None
     ) -> AsyncGenerator[str, None]:
-        """基于PRD文本和图片组合生成测试用例（支持纯文本模式）"""
+        """基于PRD文本和图片组合生成测试用例（支持纯文本模式）
+
+        generation_mode 为 sectioned 时按章节拆分并发生成，auto 时PRD文本超过阈值才拆分，single 时整体生成；
+        output_format 为 json 时模型以结构化JSON输出，由服务端渲染为Markdown，省去重复输出的Token；
+        整体生成前预估输入Token，超出预算时删减低价值章节、缩小图片或改为分章节生成，结束时报告预估与实际用量
+        """
+        output_format = output_format or self.default_output_format
+        ticket = None
+        usage: Dict[str, int] = {}
+        failed_sections: List[str] = []
+        resumable = False
+        plan = None
+        cached_markdown = None
         try:
-            ag_images = []
-            if prd_images:  # 只有当有图片时才处理
-                for i, image_path in enumerate(prd_images):
-                    try:
-                        print(f"处理第{i+1}张图片: {image_path}")
-                        
-                        # 检查文件是否存在
-                        if not os.path.exists(image_path):
-                            print(f"跳过第{i+1}张图片：文件不存在 {image_path}")
-                            continue
-                        
-                        # 使用PIL直接打开文件路径，使用上下文管理器确保文件正确关闭
-                        with PILImage.open(image_path) as pil_image:
-                            # 验证图片尺寸
-                            if pil_image.size[0] > 0 and pil_image.size[1] > 0:
-                                # 创建AGImage对象时需要复制图片，避免文件关闭后无法访问
-                                pil_image_copy = pil_image.copy()
-                                ag_image = AGImage(pil_image_copy)
-                                ag_images.append(ag_image)
-                                print(f"成功处理第{i+1}张图片")
-                            else:
-                                print(f"跳过第{i+1}张图片")
-                            
-                    except Exception as e:
-                        import traceback
-                        print(f"处理第{i+1}张图片时出错: {e}")
-                        print(f"错误堆栈: {traceback.format_exc()}")
-                        continue
-            
-            # 创建组合提示词
-            prompt = TestCasePrompts.get_multimodal_prd_prompt(prd_text, context, requirements)
+            sections = None
+            if generation_mode == "sectioned" or (
+                generation_mode == "auto" and len(prd_text or "") > self.sectioned_threshold_chars
+            ):
+                sections = split_prd_sections(prd_text, prd_images)
+                if len(sections) < 2:
+                    sections = None
 
-            content = [prompt] + ag_images
-            multi_modal_message = AGMultiModalMessage(content=content, source="user")
-            
-            agent = AssistantAgent(
-                name="agent",
-                model_client=model_client,
-                system_message=SystemMessages.MULTIMODAL_ANALYSIS,
-                model_client_stream=True,
-            )
+            if sections is None:
+                plan = await asyncio.to_thread(
+                    self.token_budget.fit,
+                    prd_text,
+                    prd_images,
+                    lambda text: SystemMessages.MULTIMODAL_ANALYSIS + TestCasePrompts.get_multimodal_prd_prompt(
+                        text, context, requirements, output_format
+                    ),
+                    generation_mode == "auto"
+                )
+                if not plan.fits:
+                    raise ValueError(ErrorMessages.get_token_budget_error(plan.estimated_tokens, plan.budget))
+                prd_text, prd_images, sections = plan.prd_text, plan.prd_images, plan.sections
+
+            # 相同的输入命中缓存时直接回放，跳过图片处理和模型调用
+            cache_key = None
+            if self.generation_cache.enabled:
+                variants = (
+                    "sectioned" if sections else "",
+                    "json-cases" if output_format == "json" else "",
+                    f"edge{plan.image_max_edge}" if plan and plan.image_max_edge else "",
+                )
+                cache_key = await asyncio.to_thread(
+                    self.generation_cache.make_key,
+                    prd_text, prd_images, context, requirements,
+                    SystemMessages.MULTIMODAL_ANALYSIS, MODEL_NAME,
+                    "+".join(variant for variant in variants if variant)
+                )
+                cached_markdown = await asyncio.to_thread(self.generation_cache.get, cache_key)
+
+            if cached_markdown is not None:
+                print("命中生成缓存，直接回放已生成的测试用例")
+                chunks = (
+                    self._replay_cached_cases(cached_markdown) if output_format == "json"
+                    else self._replay_cached_markdown(cached_markdown)
+                )
+            elif sections:
+                print(f"PRD拆分为 {len(sections)} 个章节并发生成")
+                chunks = self._stream_sectioned_output(
+                    sections, prd_text, context, requirements, client_id, failed_sections, output_format, usage
+                )
+            else:
+                # 模型调用需经过准入控制，超出并发或限速时排队
+                usage["estimated_prompt_tokens"] = plan.estimated_tokens
+                ticket = self.llm_scheduler.enqueue(client_id, plan.estimated_tokens + self.output_token_estimate)
+                prompt = TestCasePrompts.get_multimodal_prd_prompt(prd_text, context, requirements, output_format)
+                chunks = self._stream_resumable(prompt, prd_images, usage, output_format, plan.image_max_edge)
+                resumable = self.max_resumes > 0
             
             # 首先输出标题
             yield "# 正在生成测试用例...\n\n"
+            if plan is not None and plan.adjustments:
+                yield f"> 为控制请求规模（输入预算 {plan.budget} Token），已自动调整：{'；'.join(plan.adjustments)}\n\n"
+
+            # 排队期间向客户端推送排队位置
+            if ticket is not None:
+                async for position in self.llm_scheduler.wait(ticket):
+                    yield self._format_queue_marker(position)
             
-            # 初始化markdown缓冲区
-            markdown_buffer = ""
+            # 增量解析器，每个用例的步骤表格结束时立即产出结构化数据
+            parser = StreamingTestCaseParser()
+            markdown_parts = []
+            # 结构化输出直接产出用例字典，渲染的Markdown只用于显示，不再解析
+            structured_cases: List[Dict[str, Any]] = []
+            # 可续写的输出中，用例到下一个检查点才确认完整并输出标记，续写时丢弃检查点之后的内容
+            held_cases: List[Dict[str, Any]] = []
+            checkpoint_parts = checkpoint_cases = 0
             
             # 流式输出生成的测试用例
-            async for event in agent.run_stream(task=multi_modal_message):
-                if isinstance(event, ModelClientStreamingChunkEvent):
-                    content = event.content
-                    markdown_buffer += content
+            async for content in chunks:
+                if isinstance(content, dict):
+                    structured_cases.append(content)
+                    yield self._generate_markdown_from_test_cases([TestCase.model_validate(content)]) + "\n"
+                    yield self._format_test_case_marker(content)
+                    continue
+                if content == CHECKPOINT_MARKER:
+                    held_cases.extend(parser.checkpoint())
+                    for test_case in held_cases:
+                        yield self._format_test_case_marker(test_case)
+                    held_cases = []
+                    checkpoint_parts, checkpoint_cases = len(markdown_parts), len(parser.test_cases)
+                    yield content
+                    continue
+                if content == RESUME_MARKER:
+                    parser.discard(checkpoint_cases)
+                    del markdown_parts[checkpoint_parts:]
+                    held_cases = []
                     yield content
-                elif isinstance(event, TaskResult):
-                    pass
+                    continue
+                markdown_parts.append(content)
+                yield content
+                for test_case in parser.feed(content):
+                    if resumable:
+                        held_cases.append(test_case)
+                    else:
+                        yield self._format_test_case_marker(test_case)
             
-            # 在流式输出结束后，尝试从Markdown中提取测试用例
-            test_cases_json = self._extract_test_cases_from_markdown(markdown_buffer)
+            for test_case in held_cases + parser.close():
+                yield self._format_test_case_marker(test_case)
+            
+            # 流式输出结束后汇总已解析的测试用例，无需再次解析全文
+            test_cases_json = structured_cases if output_format == "json" else parser.test_cases
+            if test_cases_json and self.dedupe_mode in ("report", "merge"):
+                deduplicated, merged = await asyncio.to_thread(self.deduplicator.deduplicate, test_cases_json)
+                if merged:
+                    removed = self.dedupe_mode == "merge"
+                    if removed:
+                        test_cases_json = deduplicated
+                    yield "\n\n" + format_merge_report(merged, removed=removed) + "\n"
             if test_cases_json:
                 # 只输出隐藏的JSON注释，供后端处理使用，前端会解析但不显示
                 yield "\n\n<!-- TEST_CASES_JSON: " + json.dumps(test_cases_json) + " -->\n"
+
+                # 输出生成ID，前端可凭此直接导出而无需回传用例数据
+                generation_id = self.generation_store.put(test_cases_json)
+                yield "<!-- GENERATION_ID: " + generation_id + " -->\n"
+
+                # 只缓存成功解析出测试用例且没有章节失败的完整生成结果，结构化输出缓存用例JSON
+                if cache_key is not None and cached_markdown is None and not failed_sections:
+                    cached_value = json.dumps(structured_cases) if output_format == "json" else "".join(markdown_parts)
+                    await asyncio.to_thread(self.generation_cache.set, cache_key, cached_value)
+
+            # 报告本次请求预估与实际的Token用量
+            yield self._format_token_usage_marker(usage, plan, cached_markdown is not None)
                 
         except Exception as e:
             error_message = ErrorMessages.get_generation_error(str(e))
             yield f"\n\n**错误:** {error_message}\n\n"
-            
+        finally:
+            if ticket is not None:
+                self.llm_scheduler.release(ticket, usage.get("total_tokens"))
+
+    def _fit_section(self, prompt: str, images: List[Union[bytes, str]]) -> Tuple[Optional[int], int]:
+        """预估单个章节请求的输入Token，超出预算时缩小该章节的图片，返回 (图片长边上限, 预估Token数)"""
+        text_tokens = self.token_budget.estimator.count_text(SystemMessages.MULTIMODAL_ANALYSIS + prompt)
+        image_max_edge, image_tokens = self.token_budget.fit_images(images, text_tokens)
+        return image_max_edge, text_tokens + image_tokens
+
+    def _record_usage(self, usage: Dict[str, int], prompt_tokens: int, completion_tokens: int) -> None:
+        """累加实际Token用量，分章节生成时各章节的用量汇总到同一字典"""
+        for key, value in (
+            ("prompt_tokens", prompt_tokens),
+            ("completion_tokens", completion_tokens),
+            ("total_tokens", prompt_tokens + completion_tokens),
+        ):
+            usage[key] = usage.get(key, 0) + value
+
+    def _stream_generation(
+        self,
+        prompt: str,
+        prd_images: List[Union[bytes, str]],
+        usage: Dict[str, int],
+        output_format: str,
+        image_max_edge: int = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """按输出格式选择生成方式：markdown 逐块产出文本，json 逐个产出解析好的用例字典"""
+        if output_format == "json":
+            return self._stream_structured_output(prompt, prd_images, usage, image_max_edge)
+        return self._stream_model_output(prompt, prd_images, usage, image_max_edge)
+
+    async def _stream_resumable(
+        self,
+        prompt: str,
+        prd_images: List[Union[bytes, str]],
+        usage: Dict[str, int],
+        output_format: str,
+        image_max_edge: int = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """
+        可续写的生成：以已完整输出的用例为检查点，上游连接中断、超时等临时故障时
+        请求模型从最后一个完整用例之后继续，续写的用例接续编号并跳过已生成的用例，调用方看到的是一条连续的输出
+
+        Markdown输出逐块实时产出，每个用例前产出检查点标记；续写前产出续写标记，
+        调用方据此丢弃最后一个检查点之后未完成的用例
+        """
+        if self.max_resumes <= 0:
+            async for content in self._stream_generation(prompt, prd_images, usage, output_format, image_max_edge):
+                yield content
+            return
+
+        checkpoint = GenerationCheckpoint()
+        current_prompt = prompt
+        while True:
+            try:
+                async for content in self._stream_generation(current_prompt, prd_images, usage, output_format, image_max_edge):
+                    if isinstance(content, dict):
+                        test_case = checkpoint.add_case(content)
+                        if test_case is not None:
+                            yield test_case
+                        continue
+                    for piece in checkpoint.feed(content):
+                        yield piece
+                for piece in checkpoint.close():
+                    yield piece
+                return
+            except Exception as e:
+                if checkpoint.attempt >= self.max_resumes or not self._is_transient_error(e):
+                    raise
+                last_id = checkpoint.last_id or "开头"
+                checkpoint.resume()
+                print(f"生成在 {last_id} 之后中断（{type(e).__name__}: {e}），第 {checkpoint.attempt} 次续写")
+                # 结构化输出只产出完整用例，无需丢弃
+                if output_format != "json":
+                    yield RESUME_MARKER
+                await asyncio.sleep(self.resume_backoff * checkpoint.attempt)
+                current_prompt = TestCasePrompts.get_continuation_prompt(prompt, checkpoint.completed, last_id)
+
+    def _is_transient_error(self, error: Exception) -> bool:
+        """
+        连接中断、超时和服务端5xx错误可以续写重试，参数错误等其余异常直接失败
+
+        上游限流（429）不续写：续写请求不经过准入控制的RPM/TPM限速，重试只会加重限流
+        """
+        return isinstance(error, (
+            openai.APIConnectionError,
+            openai.InternalServerError,
+            httpx.TransportError,
+            asyncio.TimeoutError,
+        ))
+
+    async def _stream_structured_output(
+        self,
+        prompt: str,
+        prd_images: List[Union[bytes, str]],
+        usage: Dict[str, int] = None,
+        image_max_edge: int = None
+    ) -> AsyncGenerator[Dict[str, Any], None]:
+        """
+        以TestCase派生的JSON Schema请求结构化输出，每个用例对象闭合后立即产出解析好的字典
+        """
+        ag_images = await self.image_preprocessor.prepare(prd_images, image_max_edge) if prd_images else []
+        messages = [
+            SystemMessage(content=SystemMessages.MULTIMODAL_ANALYSIS),
+            UserMessage(content=[prompt] + ag_images, source="user"),
+        ]
+
+        parser = StreamingJSONCaseParser()
+        async for chunk in self.model_clients.client.create_stream(
+            messages, json_output=GeneratedTestCases, include_usage=True
+        ):
+            if isinstance(chunk, CreateResult):
+                if usage is not None and chunk.usage:
+                    self._record_usage(usage, chunk.usage.prompt_tokens, chunk.usage.completion_tokens)
+                continue
+            for test_case in parser.feed(chunk):
+                yield test_case
+
+    async def _stream_model_output(
+        self,
+        prompt: str,
+        prd_images: List[Union[bytes, str]],
+        usage: Dict[str, int] = None,
+        image_max_edge: int = None
+    ) -> AsyncGenerator[str, None]:
+        """调用多模态模型，逐块产出生成的Markdown文本，实际Token用量记录到usage"""
+        # 缩放、压缩并去重图片，在进程池中执行以免阻塞事件循环
+        ag_images = await self.image_preprocessor.prepare(prd_images, image_max_edge) if prd_images else []
+
+        content = [prompt] + ag_images
+        multi_modal_message = AGMultiModalMessage(content=content, source="user")
+        
+        agent = self._create_agent()
+
+        async for event in agent.run_stream(task=multi_modal_message):
+            if isinstance(event, ModelClientStreamingChunkEvent):
+                yield event.content
+            elif isinstance(event, TaskResult) and usage is not None:
+                for message in event.messages:
+                    if getattr(message, "models_usage", None):
+                        self._record_usage(usage, message.models_usage.prompt_tokens, message.models_usage.completion_tokens)
+
+    async def _stream_sectioned_output(
+        self,
+        sections: List[PRDSection],
+        prd_text: str,
+        context: str,
+        requirements: str,
+        client_id: str = None,
+        failed_sections: List[str] = None,
+        output_format: str = "markdown",
+        usage: Dict[str, int] = None
+    ) -> AsyncGenerator[Union[str, Dict[str, Any]], None]:
+        """
+        各章节在并发上限内分别调用模型，按完成顺序输出章节的测试用例
+
+        用例ID按输出顺序重新编号，与已输出用例重复的用例被丢弃，生成失败的章节标题记录到failed_sections；
+        各章节分别按Token预算适配图片尺寸，预估与实际用量汇总到usage；json 输出时逐个产出用例字典
+        """
+        outline = "\n".join(document_outline(prd_text))
+        semaphore = asyncio.Semaphore(self.section_concurrency)
+
+        async def generate_section(index: int, section: PRDSection):
+            async with semaphore:
+                ticket = None
+                section_usage: Dict[str, int] = {}
+                try:
+                    prompt = TestCasePrompts.get_section_prompt(
+                        section.text, section.title, index + 1, len(sections), outline, context, requirements, output_format
+                    )
+                    image_max_edge, estimated_tokens = await asyncio.to_thread(self._fit_section, prompt, section.images)
+                    if estimated_tokens > self.token_budget.max_input_tokens:
+                        raise ValueError(
+                            ErrorMessages.get_token_budget_error(estimated_tokens, self.token_budget.max_input_tokens)
+                        )
+                    section_usage["estimated_prompt_tokens"] = estimated_tokens
+                    # 排队已满时等待空位，章节不因准入队列暂时占满而失败
+                    ticket = await self.llm_scheduler.enqueue_when_available(
+                        client_id, estimated_tokens + self.output_token_estimate
+                    )
+                    async for _ in self.llm_scheduler.wait(ticket):
+                        pass
+                    parts = []
+                    checkpoint_index = 0
+                    async for content in self._stream_resumable(
+                        prompt, section.images, section_usage, output_format, image_max_edge
+                    ):
+                        if content == CHECKPOINT_MARKER:
+                            checkpoint_index = len(parts)
+                        elif content == RESUME_MARKER:
+                            del parts[checkpoint_index:]
+                        else:
+                            parts.append(content)
+                    if output_format == "json":
+                        return index, [part for part in parts if isinstance(part, dict)], None
+                    return index, parse_test_cases("".join(parts)), None
+                except Exception as e:
+                    return index, [], e
+                finally:
+                    if ticket is not None:
+                        self.llm_scheduler.release(ticket, section_usage.get("total_tokens"))
+                    if usage is not None:
+                        for key, value in section_usage.items():
+                            usage[key] = usage.get(key, 0) + value
+
+        tasks = [asyncio.create_task(generate_section(i, section)) for i, section in enumerate(sections)]
+        seen_keys = set()
+        case_count = 0
+        try:
+            for future in asyncio.as_completed(tasks):
+                index, section_cases, error = await future
+                if error is not None:
+                    print(f"章节「{sections[index].title}」生成失败: {error}")
+                    if failed_sections is not None:
+                        failed_sections.append(sections[index].title)
+                    yield f"\n> 章节「{sections[index].title}」生成失败: {error}\n\n"
+                    continue
+
+                merged = []
+                for test_case in section_cases:
+                    key = self._test_case_key(test_case)
+                    if key in seen_keys:
+                        continue
+                    seen_keys.add(key)
+                    case_count += 1
+                    merged.append({**test_case, "id": f"TC-{case_count:03d}"})
+                print(f"章节「{sections[index].title}」完成，新增 {len(merged)} 个测试用例")
+                if output_format == "json":
+                    for test_case in merged:
+                        yield test_case
+                elif merged:
+                    yield self._generate_markdown_from_test_cases(
+                        [TestCase.model_validate(test_case) for test_case in merged]
+                    ) + "\n"
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+
+    def _test_case_key(self, test_case: Dict[str, Any]) -> str:
+        """用于识别重复用例的规范化键：忽略空白和标点后的标题与各步骤描述"""
+        parts = [test_case.get("title", "")] + [step.get("description", "") for step in test_case.get("steps", [])]
+        return "|".join(re.sub(r"[\s\W_]+", "", part).lower() for part in parts)
+
+    async def _replay_cached_cases(self, cases_json: str) -> AsyncGenerator[Dict[str, Any], None]:
+        """逐个回放缓存的结构化用例"""
+        for test_case in json.loads(cases_json):
+            yield test_case
+
+    async def _replay_cached_markdown(self, markdown_text: str, chunk_size: int = 8192) -> AsyncGenerator[str, None]:
+        """按块回放缓存的Markdown文本"""
+        for i in range(0, len(markdown_text), chunk_size):
+            yield markdown_text[i:i + chunk_size]
 
-            
     async def generate_test_cases_stream_from_feishu(
         self,
         feishu_url: str,
         context: str,
-        requirements: str
+        requirements: str,
+        client_id: str = None,
+        generation_mode: str = "auto",
+        output_format: str = None
     ) -> AsyncGenerator[str, None]:
         """基于飞书文档URL生成测试用例"""
         if not self.feishu_service:
@@ -122,7 +526,10 @@ class AIService:
                 prd_text=document_text,
                 prd_images=document_images,
                 context=context,
-                requirements=requirements
+                requirements=requirements,
+                client_id=client_id,
+                generation_mode=generation_mode,
+                output_format=output_format
             ):
                 yield chunk
                 
@@ -132,6 +539,34 @@ class AIService:
             
 
 
+    def _format_queue_marker(self, position: int) -> str:
+        """
+        将排队位置格式化为隐藏注释，前端据此提示等待状态
+        """
+        return f"<!-- QUEUE_POSITION: {position} -->\n"
+
+    def _format_token_usage_marker(self, usage: Dict[str, int], plan: Optional[BudgetPlan], cached: bool) -> str:
+        """生成Token用量注释，包含发送前预估的输入Token和模型返回的实际用量"""
+        report = {
+            "estimated_prompt_tokens": usage.get("estimated_prompt_tokens", 0),
+            "prompt_tokens": usage.get("prompt_tokens", 0),
+            "completion_tokens": usage.get("completion_tokens", 0),
+            "budget": self.token_budget.max_input_tokens,
+            "adjustments": plan.adjustments if plan else [],
+            "cached": cached,
+        }
+        print(
+            f"Token用量：预估输入 {report['estimated_prompt_tokens']}，实际输入 {report['prompt_tokens']}，"
+            f"输出 {report['completion_tokens']}{'（缓存回放）' if cached else ''}"
+        )
+        return "<!-- TOKEN_USAGE: " + json.dumps(report, ensure_ascii=False) + " -->\n"
+
+    def _format_test_case_marker(self, test_case: Dict[str, Any]) -> str:
+        """
+        将单个已完成的测试用例格式化为隐藏的JSON注释，前端在流式过程中即可解析
+        """
+        return "<!-- TEST_CASE: " + json.dumps(test_case) + " -->"
+
     def _test_case_to_dict(self, test_case: TestCase) -> Dict[str, Any]:
         """
         将TestCase对象转换为字典格式
@@ -155,18 +590,27 @@ class AIService:
         从测试用例列表生成Markdown格式的输出
         """
         markdown_lines = []
+
+        def inline(text: str) -> str:
+            # 换行会截断标题和加粗字段，合并为一行
+            return " ".join((text or "").splitlines())
+
+        def cell(text: str) -> str:
+            # 单元格内的竖线转义，避免被当作列分隔
+            return inline(text).replace("|", "\\|")
         
         for test_case in test_cases:
             # 测试用例标题
-            markdown_lines.append(f"## {test_case.id}: {test_case.title}")
+            markdown_lines.append(f"## {test_case.id}: {inline(test_case.title)}")
             markdown_lines.append("")
             
             # 基本信息
-            markdown_lines.append(f"**优先级:** {test_case.priority}")
-            markdown_lines.append(f"**描述:** {test_case.description}")
+            if test_case.priority:
+                markdown_lines.append(f"**优先级:** {inline(test_case.priority)}")
+            markdown_lines.append(f"**描述:** {inline(test_case.description)}")
             
             if test_case.preconditions:
-                markdown_lines.append(f"**前置条件:** {test_case.preconditions}")
+                markdown_lines.append(f"**前置条件:** {inline(test_case.preconditions)}")
             
             markdown_lines.append("")
             
@@ -177,7 +621,7 @@ class AIService:
             markdown_lines.append("| --- | --- | --- |")
             
             for step in test_case.steps:
-                markdown_lines.append(f"| {step.step_number} | {step.description} | {step.expected_result} |")
+                markdown_lines.append(f"| {step.step_number} | {cell(step.description)} | {cell(step.expected_result)} |")
             
             markdown_lines.append("")
             markdown_lines.append("---")
@@ -195,82 +639,4 @@ class AIService:
         返回:
             测试用例列表
         """
-        test_cases = []
-        lines = markdown_text.split('\n')
-
-        current_test_case = None
-        current_steps = []
-        in_table = False
-        table_headers = []
-
-        for line in lines:
-            # 检测新测试用例的开始
-            if line.startswith('## '):
-                # 如果有当前测试用例，将其添加到列表中
-                if current_test_case is not None and current_steps:
-                    current_test_case['steps'] = current_steps
-                    test_cases.append(current_test_case)
-
-                # 初始化新的测试用例
-                title_parts = line[3:].strip().split(': ', 1)
-                if len(title_parts) > 1:
-                    test_id = title_parts[0].strip()
-                    title = title_parts[1].strip()
-                else:
-                    test_id = f"TC-{len(test_cases) + 1}"
-                    title = line[3:].strip()
-
-                current_test_case = {
-                    'id': test_id,
-                    'title': title,
-                    'description': '',
-                    'preconditions': None,
-                    'priority': None
-                }
-                current_steps = []
-                in_table = False
-
-            # 提取优先级
-            elif line.startswith('**优先级:**') and current_test_case:
-                current_test_case['priority'] = line.replace('**优先级:**', '').strip()
-
-            # 提取描述
-            elif line.startswith('**描述:**') and current_test_case:
-                current_test_case['description'] = line.replace('**描述:**', '').strip()
-
-            # 提取前置条件
-            elif line.startswith('**前置条件:**') and current_test_case:
-                current_test_case['preconditions'] = line.replace('**前置条件:**', '').strip()
-
-            # 检测表格头
-            elif '| --- | --- | --- |' in line:
-                in_table = True
-                # 获取前一行的表头
-                for i, prev_line in enumerate(reversed(lines[:lines.index(line)])):
-                    if '|' in prev_line:
-                        table_headers = [h.strip() for h in prev_line.split('|')[1:-1]]
-                        break
-
-            # 提取测试步骤
-            elif in_table and '|' in line and '---' not in line and len(line.split('|')) > 3:
-                cells = [cell.strip() for cell in line.split('|')[1:-1]]
-                if len(cells) >= 3:
-                    try:
-                        step_number = int(cells[0])
-                        description = cells[1]
-                        expected_result = cells[2]
-
-                        current_steps.append({
-                            'step_number': step_number,
-                            'description': description,
-                            'expected_result': expected_result
-                        })
-                    except (ValueError, IndexError):
-                        pass  # 忽略无法解析的行
-
-        # 添加最后一个测试用例
-        if current_test_case is not None and current_steps:
-            current_test_case['steps'] = current_steps
-            test_cases.append(current_test_case)
-
-        return test_cases
+        return parse_test_cases(markdown_text)
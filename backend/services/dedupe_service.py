@@ -0,0 +1,176 @@
+import os
+import re
+import zlib
+from collections import defaultdict
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+import numpy as np
+
+# 哈希置换使用的梅森素数，系数与32位的shingle哈希相乘不会溢出uint64
+_MERSENNE_PRIME = (1 << 31) - 1
+
+# 数值和取值：金额、长度等数字以及引号中的输入值，边界值用例往往只有这些不同
+_VALUE_PATTERN = re.compile(r"\d+(?:\.\d+)?|[\"“‘「](.+?)[\"”’」]")
+
+
+def _normalize(text: str) -> str:
+    """去除空白和标点并转为小写，改写措辞时的格式差异不影响相似度"""
+    return re.sub(r"[\s\W_]+", "", text or "").lower()
+
+
+def _values(test_case: Dict[str, Any]) -> Tuple[str, ...]:
+    """提取用例标题、描述和步骤中的数值和引号内的取值"""
+    parts = [test_case.get("title", ""), test_case.get("description", "")]
+    for step in test_case.get("steps", []):
+        parts.append(step.get("description", ""))
+        parts.append(step.get("expected_result", ""))
+    values = []
+    for match in _VALUE_PATTERN.finditer(" ".join(part or "" for part in parts)):
+        values.append(match.group(1) if match.group(1) is not None else match.group(0))
+    return tuple(sorted(values))
+
+
+def _optimal_bands(threshold: float, num_perm: int) -> Tuple[int, int]:
+    """选择LSH的分段数和每段行数，使候选判定的阈值 (1/b)^(1/r) 最接近相似度阈值"""
+    best = (num_perm, 1)
+    best_error = float("inf")
+    for rows in range(1, num_perm + 1):
+        if num_perm % rows:
+            continue
+        bands = num_perm // rows
+        error = abs((1 / bands) ** (1 / rows) - threshold)
+        if error < best_error:
+            best, best_error = (bands, rows), error
+    return best
+
+
+class TestCaseDeduplicator:
+    """近似重复测试用例检测
+
+    以标题和步骤文本的字符shingle集合表示用例，用MinHash签名估计Jaccard相似度，
+    再通过LSH分段分桶只比较候选对，用例数增长时耗时接近线性；
+    候选对以真实Jaccard相似度复核，且数值和取值完全相同才视为重复，避免合并只有边界值不同的用例；
+    合并时每组保留最先出现的用例。
+    """
+
+    def __init__(self, threshold: float = None, num_perm: int = None, shingle_size: int = None, seed: int = 1):
+        self.threshold = threshold if threshold is not None else float(os.getenv("DEDUPE_THRESHOLD", "0.8"))
+        self.num_perm = num_perm or int(os.getenv("DEDUPE_NUM_PERM", "64"))
+        self.shingle_size = shingle_size or int(os.getenv("DEDUPE_SHINGLE_SIZE", "3"))
+        self.bands, self.rows = _optimal_bands(self.threshold, self.num_perm)
+        rng = np.random.default_rng(seed)
+        self._a = rng.integers(1, _MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+        self._b = rng.integers(0, _MERSENNE_PRIME, size=self.num_perm, dtype=np.uint64)
+
+    def _shingles(self, test_case: Dict[str, Any]) -> Set[int]:
+        """标题和每个步骤的描述、预期结果拼接后切分为字符shingle"""
+        parts = [test_case.get("title", "")]
+        for step in test_case.get("steps", []):
+            parts.append(step.get("description", ""))
+            parts.append(step.get("expected_result", ""))
+        text = "|".join(_normalize(part) for part in parts)
+        size = self.shingle_size
+        if len(text) <= size:
+            return {zlib.crc32(text.encode("utf-8"))}
+        return {zlib.crc32(text[i:i + size].encode("utf-8")) for i in range(len(text) - size + 1)}
+
+    def _signature(self, shingles: Set[int]) -> np.ndarray:
+        values = np.fromiter(shingles, dtype=np.uint64, count=len(shingles)) % _MERSENNE_PRIME
+        hashed = (self._a[:, None] * values[None, :] + self._b[:, None]) % _MERSENNE_PRIME
+        return hashed.min(axis=1)
+
+    def find_clusters(self, test_cases: List[Dict[str, Any]]) -> List[List[int]]:
+        """
+        查找近似重复的用例组
+
+        参数:
+            test_cases: 测试用例字典列表
+
+        返回:
+            每组重复用例的下标列表（按出现顺序，至少两个），不重复的用例不出现在结果中
+        """
+        shingle_sets = [self._shingles(test_case) for test_case in test_cases]
+        value_sets = [_values(test_case) for test_case in test_cases]
+        parent = list(range(len(test_cases)))
+
+        def find(i: int) -> int:
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        def similar(i: int, j: int) -> bool:
+            if value_sets[i] != value_sets[j]:
+                return False
+            a, b = shingle_sets[i], shingle_sets[j]
+            return len(a & b) / len(a | b) >= self.threshold
+
+        buckets: Dict[Tuple[int, bytes], List[int]] = defaultdict(list)
+        for index, shingles in enumerate(shingle_sets):
+            signature = self._signature(shingles)
+            for band in range(self.bands):
+                key = signature[band * self.rows:(band + 1) * self.rows].tobytes()
+                buckets[(band, key)].append(index)
+
+        for members in buckets.values():
+            if len(members) < 2:
+                continue
+            # 桶内只与已有组的代表比较，避免大桶内两两比较
+            roots: List[int] = []
+            for index in members:
+                root = find(index)
+                for other in roots:
+                    if find(other) == root:
+                        break
+                    if similar(other, index):
+                        parent[root] = find(other)
+                        break
+                else:
+                    roots.append(index)
+
+        groups: Dict[int, List[int]] = defaultdict(list)
+        for index in range(len(test_cases)):
+            groups[find(index)].append(index)
+        return [sorted(group) for group in groups.values() if len(group) > 1]
+
+    def deduplicate(self, test_cases: List[Dict[str, Any]]) -> Tuple[List[Dict[str, Any]], Dict[str, List[str]]]:
+        """
+        合并近似重复的测试用例
+
+        参数:
+            test_cases: 测试用例字典列表
+
+        返回:
+            (保留的用例列表, {保留的用例ID: [被合并的用例ID]})
+        """
+        removed = set()
+        merged: Dict[str, List[str]] = {}
+        for group in self.find_clusters(test_cases):
+            kept, duplicates = group[0], group[1:]
+            removed.update(duplicates)
+            merged[test_cases[kept].get("id") or f"#{kept + 1}"] = [
+                test_cases[i].get("id") or f"#{i + 1}" for i in duplicates
+            ]
+        return [test_case for i, test_case in enumerate(test_cases) if i not in removed], merged
+
+
+def format_merge_report(merged: Dict[str, List[str]], limit: Optional[int] = 20, removed: bool = True) -> str:
+    """
+    将合并结果格式化为Markdown引用块
+
+    参数:
+        merged: {保留的用例ID: [重复的用例ID]}
+        limit: 最多列出的组数
+        removed: 重复的用例是否已被删除，为False时只提示疑似重复
+    """
+    removed_count = sum(len(ids) for ids in merged.values())
+    if removed:
+        lines = [f"> 已合并 {removed_count} 个近似重复的测试用例："]
+    else:
+        lines = [f"> 发现 {removed_count} 个疑似近似重复的测试用例（均已保留，请人工确认）："]
+    items = list(merged.items())
+    for kept_id, duplicate_ids in items[:limit]:
+        lines.append(f"> - {kept_id} ← {', '.join(duplicate_ids)}")
+    if limit is not None and len(items) > limit:
+        lines.append(f"> - …… 另有 {len(items) - limit} 组")
+    return "\n".join(lines)
@@ -0,0 +1,63 @@
+import os
+import zlib
+from typing import List, Optional, Tuple
+
+import diskcache
+
+
+class FeishuDocumentCache:
+    """飞书文档内容缓存
+
+    以文档ID为键保存解析后的文本和下载的媒体文件，并记录文档的修订版本号，
+    只有修订版本号一致时才命中，文档更新后自动失效并被新版本覆盖。
+    """
+
+    def __init__(self, directory: str = None, size_limit_mb: int = None, ttl_hours: float = None, enabled: bool = None):
+        self.directory = directory or os.getenv("FEISHU_CACHE_DIR", "cache/feishu")
+        self.size_limit = (size_limit_mb or int(os.getenv("FEISHU_CACHE_SIZE_MB", "1024"))) * 1024 * 1024
+        self.ttl_seconds = (ttl_hours or float(os.getenv("FEISHU_CACHE_TTL_HOURS", "168"))) * 3600
+        if enabled is None:
+            enabled = os.getenv("FEISHU_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self._cache = diskcache.Cache(self.directory, size_limit=self.size_limit) if self.enabled else None
+
+    def get(self, doc_id: str, revision_id: int) -> Optional[Tuple[str, List[Tuple[str, str, bytes]]]]:
+        """
+        读取指定修订版本的文档内容
+
+        参数:
+            doc_id: 文档ID
+            revision_id: 文档当前的修订版本号
+
+        返回:
+            (文本内容, [(文件名前缀, 扩展名, 媒体字节)])，未命中或版本不一致时返回None
+        """
+        if not self.enabled:
+            return None
+        try:
+            entry = self._cache.get(doc_id)
+            if entry is None or entry["revision_id"] != revision_id:
+                return None
+            return zlib.decompress(entry["text"]).decode("utf-8"), entry["media"]
+        except Exception as e:
+            print(f"读取飞书文档缓存失败: {e}")
+            return None
+
+    def set(self, doc_id: str, revision_id: int, text: str, media: List[Tuple[str, str, bytes]]) -> None:
+        """写入文档内容，覆盖该文档之前版本的缓存"""
+        if not self.enabled:
+            return
+        try:
+            entry = {
+                "revision_id": revision_id,
+                "text": zlib.compress(text.encode("utf-8")),
+                "media": media
+            }
+            self._cache.set(doc_id, entry, expire=self.ttl_seconds)
+        except Exception as e:
+            print(f"写入飞书文档缓存失败: {e}")
+
+    def close(self) -> None:
+        """关闭底层存储"""
+        if self._cache is not None:
+            self._cache.close()
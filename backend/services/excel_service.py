@@ -1,15 +1,68 @@
 import os
-import pandas as pd
-from typing import List, Dict, Any, Union
+import uuid
+import xlsxwriter
+from typing import List, Dict, Any, Union, Iterable, Iterator
 from datetime import datetime
 from models.test_case import TestCase
 
 class ExcelService:
+    COLUMNS = [
+        "ID",
+        "Title",
+        "Description",
+        "Preconditions",
+        "Priority",
+        "Step Number",
+        "Step Description",
+        "Expected Result"
+    ]
+
     def __init__(self):
         self.results_dir = "results"
         os.makedirs(self.results_dir, exist_ok=True)
 
-    def generate_excel(self, test_cases: List[Union[TestCase, Dict[str, Any]]], filename_prefix: str = "test_cases") -> str:
+    def iter_rows(self, test_cases: Iterable[Union[TestCase, Dict[str, Any]]]) -> Iterator[List[Any]]:
+        """
+        将测试用例展开为按 COLUMNS 排列的行，每个步骤一行，
+        只有第一个步骤所在行包含测试用例信息
+
+        参数:
+            test_cases: 测试用例（TestCase 对象或从 Markdown 提取的字典）的可迭代对象
+
+        返回:
+            行数据的迭代器
+        """
+        for tc in test_cases:
+            # 检查是否为字典类型（从 Markdown 提取的数据）
+            if isinstance(tc, dict):
+                test_case_info = [
+                    tc.get('id', ''),
+                    tc.get('title', ''),
+                    tc.get('description', ''),
+                    tc.get('preconditions', '') or "",
+                    tc.get('priority', '') or "Medium"
+                ]
+                steps = [
+                    (step.get('step_number', i + 1), step.get('description', ''), step.get('expected_result', ''))
+                    for i, step in enumerate(tc.get('steps', []))
+                ]
+            else:
+                # 处理 TestCase 对象
+                test_case_info = [
+                    tc.id,
+                    tc.title,
+                    tc.description,
+                    tc.preconditions or "",
+                    tc.priority or "Medium"
+                ]
+                steps = [(step.step_number, step.description, step.expected_result) for step in tc.steps]
+
+            for i, step in enumerate(steps):
+                # 后续步骤只包含步骤信息
+                info = test_case_info if i == 0 else ["", "", "", "", ""]
+                yield [*info, *step]
+
+    def generate_excel(self, test_cases: Iterable[Union[TestCase, Dict[str, Any]]], filename_prefix: str = "test_cases") -> str:
         """
         从测试用例生成Excel文件
 
@@ -20,94 +73,14 @@ class ExcelService:
         返回:
             生成的Excel文件的路径
         """
-        # 为文件名创建时间戳
+        # 时间戳便于辨认，UUID保证并发导出时文件名不会冲突
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-        filename = f"{filename_prefix}_{timestamp}.xlsx"
+        filename = f"{filename_prefix}_{timestamp}_{uuid.uuid4().hex}.xlsx"
         filepath = os.path.join(self.results_dir, filename)
 
-        # 为测试用例创建数据帧
-        test_case_data = []
-        for tc in test_cases:
-            # 检查是否为字典类型（从 Markdown 提取的数据）
-            if isinstance(tc, dict):
-                # 添加主要测试用例信息
-                test_case_info = {
-                    "ID": tc.get('id', ''),
-                    "Title": tc.get('title', ''),
-                    "Description": tc.get('description', ''),
-                    "Preconditions": tc.get('preconditions', '') or "",
-                    "Priority": tc.get('priority', '') or "Medium"
-                }
-
-                # 将每个步骤作为单独的行添加
-                steps = tc.get('steps', [])
-                for i, step in enumerate(steps):
-                    if i == 0:
-                        # 第一个步骤使用测试用例信息
-                        row = {
-                            **test_case_info,
-                            "Step Number": step.get('step_number', i+1),
-                            "Step Description": step.get('description', ''),
-                            "Expected Result": step.get('expected_result', '')
-                        }
-                    else:
-                        # 后续步骤只包含步骤信息
-                        row = {
-                            "ID": "",
-                            "Title": "",
-                            "Description": "",
-                            "Preconditions": "",
-                            "Priority": "",
-                            "Step Number": step.get('step_number', i+1),
-                            "Step Description": step.get('description', ''),
-                            "Expected Result": step.get('expected_result', '')
-                        }
-                    test_case_data.append(row)
-            else:
-                # 处理 TestCase 对象
-                # 添加主要测试用例信息
-                test_case_info = {
-                    "ID": tc.id,
-                    "Title": tc.title,
-                    "Description": tc.description,
-                    "Preconditions": tc.preconditions or "",
-                    "Priority": tc.priority or "Medium"
-                }
-
-                # 将每个步骤作为单独的行添加
-                for i, step in enumerate(tc.steps):
-                    if i == 0:
-                        # 第一个步骤使用测试用例信息
-                        row = {
-                            **test_case_info,
-                            "Step Number": step.step_number,
-                            "Step Description": step.description,
-                            "Expected Result": step.expected_result
-                        }
-                    else:
-                        # 后续步骤只包含步骤信息
-                        row = {
-                            "ID": "",
-                            "Title": "",
-                            "Description": "",
-                            "Preconditions": "",
-                            "Priority": "",
-                            "Step Number": step.step_number,
-                            "Step Description": step.description,
-                            "Expected Result": step.expected_result
-                        }
-                    test_case_data.append(row)
-
-        # 创建数据帧并写入Excel
-        df = pd.DataFrame(test_case_data)
-
-        # 使用xlsxwriter引擎创建写入器
-        writer = pd.ExcelWriter(filepath, engine='xlsxwriter')
-        df.to_excel(writer, sheet_name='Test Cases', index=False)
-
-        # 获取xlsxwriter工作簿和工作表对象
-        workbook = writer.book
-        worksheet = writer.sheets['Test Cases']
+        # constant_memory 模式下逐行写出，内存占用与数据量无关
+        workbook = xlsxwriter.Workbook(filepath, {'constant_memory': True})
+        worksheet = workbook.add_worksheet('Test Cases')
 
         # 添加一些格式化
         header_format = workbook.add_format({
@@ -118,10 +91,6 @@ class ExcelService:
             'border': 1
         })
 
-        # 使用标题格式写入列标题
-        for col_num, value in enumerate(df.columns.values):
-            worksheet.write(0, col_num, value, header_format)
-
         # 设置列宽
         worksheet.set_column('A:A', 10)  # ID
         worksheet.set_column('B:B', 30)  # Title
@@ -132,8 +101,14 @@ class ExcelService:
         worksheet.set_column('G:G', 40)  # Step Description
         worksheet.set_column('H:H', 40)  # Expected Result
 
-        # 关闭写入器
-        writer.close()
+        # 使用标题格式写入列标题
+        worksheet.write_row(0, 0, self.COLUMNS, header_format)
+
+        # 将每个步骤作为单独的行写入
+        for row_num, row in enumerate(self.iter_rows(test_cases), start=1):
+            worksheet.write_row(row_num, 0, row)
+
+        workbook.close()
 
         return filepath
 
@@ -0,0 +1,131 @@
+import asyncio
+import os
+import time
+from concurrent.futures import BrokenExecutor, Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional, Tuple
+
+
+class ExportQueueFullError(Exception):
+    """导出队列已满"""
+
+
+def _timed_call(func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Tuple[Any, float, float]:
+    """在工作进程中执行导出任务，并记录实际开始和结束的时间戳"""
+    started_at = time.time()
+    result = func(*args, **kwargs)
+    return result, started_at, time.time()
+
+
+class ExportExecutor:
+    """导出任务执行器
+
+    在独立的有界进程池（或线程池）中生成导出文件，避免阻塞事件循环上的流式生成；
+    排队和执行中的任务数达到上限时拒绝新任务，由调用方返回429；
+    工作进程异常退出导致执行器损坏时重建执行器并重新提交一次。
+    """
+
+    def __init__(self, max_workers: int = None, max_pending: int = None, kind: str = None):
+        self.max_workers = max_workers or int(os.getenv("EXPORT_WORKERS", "2"))
+        # 排队和执行中的任务总数上限
+        self.max_pending = max_pending or int(os.getenv("EXPORT_QUEUE_DEPTH", "8"))
+        self.kind = (kind or os.getenv("EXPORT_EXECUTOR", "process")).lower()
+        self._executor: Optional[Executor] = None
+        self._pending = 0
+        self._metrics = {
+            "submitted": 0,
+            "rejected": 0,
+            "completed": 0,
+            "failed": 0,
+            "pool_restarts": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+            "build_time_total": 0.0,
+            "build_time_max": 0.0,
+        }
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.kind == "thread":
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="export")
+            else:
+                self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _reset_executor(self, executor: Executor) -> None:
+        """丢弃已损坏的执行器，下次提交时重新创建"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            self._metrics["pool_restarts"] += 1
+            print("导出执行器已损坏，重新创建")
+
+    async def _submit(self, func: Callable, args: Tuple, kwargs: Dict[str, Any]) -> Tuple[Any, float, float]:
+        """提交到当前执行器，执行器损坏时将其丢弃后抛出异常"""
+        executor = self._get_executor()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(executor, _timed_call, func, args, kwargs)
+        except BrokenExecutor:
+            self._reset_executor(executor)
+            raise
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        提交导出任务并等待结果
+
+        参数:
+            func: 要执行的导出函数，使用进程池时需可被pickle
+            *args, **kwargs: 传给导出函数的参数
+
+        返回:
+            导出函数的返回值
+
+        异常:
+            ExportQueueFullError: 排队任务已达上限
+        """
+        if self._pending >= self.max_pending:
+            self._metrics["rejected"] += 1
+            raise ExportQueueFullError(f"导出任务繁忙，当前排队 {self._pending} 个，请稍后重试")
+
+        self._pending += 1
+        self._metrics["submitted"] += 1
+        submitted_at = time.time()
+        try:
+            try:
+                result, started_at, finished_at = await self._submit(func, args, kwargs)
+            except BrokenExecutor:
+                # 工作进程被终止等原因导致执行器损坏，用新的执行器重试一次
+                result, started_at, finished_at = await self._submit(func, args, kwargs)
+        except Exception:
+            self._metrics["failed"] += 1
+            raise
+        finally:
+            self._pending -= 1
+
+        queue_wait = max(0.0, started_at - submitted_at)
+        build_time = finished_at - started_at
+        self._metrics["completed"] += 1
+        self._metrics["queue_wait_total"] += queue_wait
+        self._metrics["queue_wait_max"] = max(self._metrics["queue_wait_max"], queue_wait)
+        self._metrics["build_time_total"] += build_time
+        self._metrics["build_time_max"] = max(self._metrics["build_time_max"], build_time)
+        return result
+
+    def stats(self) -> Dict[str, Any]:
+        """返回导出队列的当前状态和累计指标"""
+        completed = self._metrics["completed"]
+        return {
+            **self._metrics,
+            "pending": self._pending,
+            "max_pending": self.max_pending,
+            "workers": self.max_workers,
+            "queue_wait_avg": self._metrics["queue_wait_total"] / completed if completed else 0.0,
+            "build_time_avg": self._metrics["build_time_total"] / completed if completed else 0.0,
+        }
+
+    def shutdown(self) -> None:
+        """关闭执行器"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+export_executor = ExportExecutor()
@@ -0,0 +1,196 @@
+import asyncio
+import json
+import os
+import re
+import time
+import uuid
+from datetime import datetime
+from typing import Any, Dict, List, Optional, Set, Union
+
+from models.test_case import TestCase
+from .excel_service import excel_service
+from .export_executor import export_executor, ExportQueueFullError
+from .result_store import result_store
+
+
+class ExportJobManager:
+    """异步导出任务管理器
+
+    提交后立即返回任务ID，导出在后台的导出执行器中完成；
+    任务状态以JSON文件持久化，服务重启后仍可查询，生成的文件保存在results目录；
+    导出文件被淘汰后任务标记为已过期，已结束的任务记录按导出文件的保留时间清理。
+    """
+
+    STATUS_PENDING = "pending"
+    STATUS_RUNNING = "running"
+    STATUS_COMPLETED = "completed"
+    STATUS_FAILED = "failed"
+    STATUS_EXPIRED = "expired"
+
+    _JOB_ID_PATTERN = re.compile(r"^[0-9a-f]{32}$")
+
+    def __init__(self, directory: str = None, max_active: int = None):
+        self.directory = directory or os.getenv("EXPORT_JOBS_DIR", "jobs")
+        # 未完成任务数上限，超过时拒绝新任务
+        self.max_active = max_active or int(os.getenv("EXPORT_MAX_ACTIVE_JOBS", "32"))
+        os.makedirs(self.directory, exist_ok=True)
+        # 后台任务同时占用的导出执行器名额，不超过工作进程数，给同步导出留出余量
+        self._semaphore = asyncio.Semaphore(export_executor.max_workers)
+        self._tasks: Set[asyncio.Task] = set()
+
+    def _job_path(self, job_id: str) -> str:
+        return os.path.join(self.directory, f"{job_id}.json")
+
+    def _save(self, job: Dict[str, Any]) -> None:
+        """原子地写入任务记录"""
+        job["updated_at"] = datetime.now().isoformat()
+        tmp_path = self._job_path(job["job_id"]) + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f, ensure_ascii=False)
+        os.replace(tmp_path, self._job_path(job["job_id"]))
+
+    def _load(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """读取任务记录，不检查导出文件，可在线程中调用"""
+        try:
+            with open(self._job_path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, ValueError):
+            return None
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        """
+        查询任务记录
+
+        参数:
+            job_id: 任务ID
+
+        返回:
+            任务记录，不存在时返回None；已完成但导出文件已被淘汰的任务标记为已过期
+        """
+        if not self._JOB_ID_PATTERN.match(job_id):
+            return None
+        job = self._load(job_id)
+        if job is None:
+            return None
+
+        # 结果索引只在事件循环线程中访问
+        if job["status"] == self.STATUS_COMPLETED and result_store.get(job["filename"]) is None:
+            job["status"] = self.STATUS_EXPIRED
+            job["error"] = "导出文件已过期清理，请重新导出"
+            self._save(job)
+        return job
+
+    async def submit(
+        self,
+        test_cases: List[Union[TestCase, Dict[str, Any]]],
+        filename_prefix: str = "test_cases",
+        owner: str = None
+    ) -> Dict[str, Any]:
+        """
+        创建导出任务并在后台执行
+
+        参数:
+            test_cases: 要导出的测试用例
+            filename_prefix: 生成的文件名前缀
+            owner: 发起导出的客户端标识
+
+        返回:
+            新建的任务记录
+
+        异常:
+            ExportQueueFullError: 未完成的任务已达上限
+        """
+        if len(self._tasks) >= self.max_active:
+            raise ExportQueueFullError(f"导出任务繁忙，当前有 {len(self._tasks)} 个任务未完成，请稍后重试")
+
+        job = {
+            "job_id": uuid.uuid4().hex,
+            "status": self.STATUS_PENDING,
+            "case_count": len(test_cases),
+            "filename": None,
+            "error": None,
+            "created_at": datetime.now().isoformat(),
+        }
+        self._save(job)
+
+        task = asyncio.create_task(self._run(job, test_cases, filename_prefix, owner))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+        return job
+
+    async def _run(
+        self,
+        job: Dict[str, Any],
+        test_cases: List[Union[TestCase, Dict[str, Any]]],
+        filename_prefix: str,
+        owner: str
+    ) -> None:
+        async with self._semaphore:
+            job["status"] = self.STATUS_RUNNING
+            self._save(job)
+            try:
+                while True:
+                    try:
+                        excel_path = await export_executor.run(excel_service.generate_excel, test_cases, filename_prefix)
+                        break
+                    except ExportQueueFullError:
+                        # 同步导出占满队列时稍后重试，后台任务不需要立即失败
+                        await asyncio.sleep(1)
+                result_store.register(excel_path, owner=owner, case_count=len(test_cases))
+                job["status"] = self.STATUS_COMPLETED
+                job["filename"] = os.path.basename(excel_path)
+            except asyncio.CancelledError:
+                job["status"] = self.STATUS_FAILED
+                job["error"] = "服务关闭，任务已中断"
+                self._save(job)
+                raise
+            except Exception as e:
+                job["status"] = self.STATUS_FAILED
+                job["error"] = str(e)
+            self._save(job)
+
+    def recover(self) -> None:
+        """启动时将上次运行中断的任务标记为失败"""
+        for entry in os.scandir(self.directory):
+            if not entry.name.endswith(".json"):
+                continue
+            job = self._load(entry.name[:-5])
+            if job and job["status"] in (self.STATUS_PENDING, self.STATUS_RUNNING):
+                job["status"] = self.STATUS_FAILED
+                job["error"] = "服务重启，任务已中断"
+                self._save(job)
+
+    def prune(self, max_age_seconds: float = None) -> int:
+        """
+        删除已结束且超过保留时间的任务记录，默认与导出文件的保留时间一致
+
+        参数:
+            max_age_seconds: 任务记录的保留秒数
+
+        返回:
+            删除的记录数
+        """
+        max_age_seconds = max_age_seconds or result_store.max_age_seconds
+        expire_before = time.time() - max_age_seconds
+        removed = 0
+        for entry in os.scandir(self.directory):
+            try:
+                if entry.stat().st_mtime >= expire_before:
+                    continue
+                if entry.name.endswith(".json"):
+                    job = self._load(entry.name[:-5])
+                    if job is not None and job["status"] in (self.STATUS_PENDING, self.STATUS_RUNNING):
+                        continue
+                os.remove(entry.path)
+                removed += 1
+            except OSError:
+                continue
+        return removed
+
+    async def shutdown(self) -> None:
+        """取消所有未完成的后台任务"""
+        for task in list(self._tasks):
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+
+export_job_manager = ExportJobManager()
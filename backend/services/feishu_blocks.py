@@ -0,0 +1,220 @@
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+"""这个模块负责把飞书新版文档(docx)的块列表还原为结构化的Markdown文本，
+并在同一次遍历中按文档顺序收集图片，图片在文本中以占位符标记位置。"""
+
+# 飞书文档块类型
+PAGE = 1
+TEXT = 2
+HEADING_TYPES = {3 + i: i + 1 for i in range(9)}  # heading1 ~ heading9
+BULLET = 12
+ORDERED = 13
+CODE = 14
+QUOTE = 15
+TODO = 17
+CALLOUT = 19
+DIVIDER = 22
+FILE = 23
+IMAGE = 27
+TABLE = 31
+TABLE_CELL = 32
+QUOTE_CONTAINER = 34
+
+# 各类型块中保存文本元素的字段名
+BLOCK_TEXT_KEYS = {
+    PAGE: "page",
+    TEXT: "text",
+    BULLET: "bullet",
+    ORDERED: "ordered",
+    CODE: "code",
+    QUOTE: "quote",
+    TODO: "todo",
+    **{block_type: f"heading{level}" for block_type, level in HEADING_TYPES.items()},
+}
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
+
+# 图片占位符，下载完成后替换为 [图片N]
+_MEDIA_PLACEHOLDER = "\x00MEDIA{}\x00"
+_MEDIA_PLACEHOLDER_PATTERN = re.compile("\x00MEDIA(\\d+)\x00")
+
+
+def is_image_file(filename: str) -> bool:
+    """检查文件是否为图片文件"""
+    if not filename:
+        return False
+    file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
+    return f'.{file_ext}' in IMAGE_EXTENSIONS
+
+
+def _elements_text(block: Dict[str, Any], block_type: int) -> str:
+    """拼接块中文本元素的内容"""
+    key = BLOCK_TEXT_KEYS.get(block_type)
+    if key is None:
+        return ""
+    parts = []
+    for element in block.get(key, {}).get("elements", []):
+        if "text_run" in element:
+            parts.append(element["text_run"].get("content", ""))
+        elif "mention_doc" in element:
+            parts.append(element["mention_doc"].get("title", ""))
+        elif "equation" in element:
+            parts.append(element["equation"].get("content", "").strip())
+    return "".join(parts)
+
+
+class _DocumentRenderer:
+    """按块树深度优先遍历，生成Markdown行并收集媒体"""
+
+    def __init__(self, blocks: List[Dict[str, Any]]):
+        self.blocks_by_id = {block.get("block_id"): block for block in blocks}
+        self.blocks = blocks
+        self.lines: List[str] = []
+        self.media_items: List[Tuple[str, str, str]] = []
+
+    def render(self) -> Tuple[str, List[Tuple[str, str, str]]]:
+        root = next((block for block in self.blocks if block.get("block_type") == PAGE), None)
+        if root is not None:
+            title = _elements_text(root, PAGE).strip()
+            if title:
+                self.lines.extend([f"# {title}", ""])
+            self._render_children(root, depth=0)
+        else:
+            # 没有页面块时退化为按列表顺序渲染顶层块
+            child_ids = {child for block in self.blocks for child in block.get("children", [])}
+            for block in self.blocks:
+                if block.get("block_id") not in child_ids:
+                    self._render_block(block, depth=0, ordinal=1)
+
+        text = "\n".join(self.lines)
+        return re.sub(r"\n{3,}", "\n\n", text).strip() + "\n", self.media_items
+
+    def _children(self, block: Dict[str, Any]) -> List[Dict[str, Any]]:
+        return [self.blocks_by_id[child] for child in block.get("children", []) if child in self.blocks_by_id]
+
+    def _render_children(self, block: Dict[str, Any], depth: int) -> None:
+        ordinal = 0
+        for child in self._children(block):
+            # 连续的有序列表项依次编号
+            ordinal = ordinal + 1 if child.get("block_type") == ORDERED else 0
+            self._render_block(child, depth, ordinal)
+
+    def _media_placeholder(self, kind: str, token: str, filename: str) -> str:
+        self.media_items.append((kind, token, filename))
+        return _MEDIA_PLACEHOLDER.format(len(self.media_items) - 1)
+
+    def _render_block(self, block: Dict[str, Any], depth: int, ordinal: int) -> None:
+        block_type = block.get("block_type")
+        indent = "  " * depth
+        text = _elements_text(block, block_type)
+
+        if block_type in HEADING_TYPES:
+            level = min(HEADING_TYPES[block_type] + 1, 6)  # 一级标题留给文档标题
+            self.lines.extend(["", f"{'#' * level} {text.strip()}", ""])
+        elif block_type == TEXT:
+            self.lines.append(f"{indent}{text}" if text.strip() else "")
+        elif block_type == BULLET:
+            self.lines.append(f"{indent}- {text}")
+            self._render_children(block, depth + 1)
+            return
+        elif block_type == ORDERED:
+            self.lines.append(f"{indent}{ordinal}. {text}")
+            self._render_children(block, depth + 1)
+            return
+        elif block_type == TODO:
+            done = block.get("todo", {}).get("style", {}).get("done", False)
+            self.lines.append(f"{indent}- [{'x' if done else ' '}] {text}")
+            self._render_children(block, depth + 1)
+            return
+        elif block_type == CODE:
+            self.lines.extend(["```", text, "```"])
+        elif block_type == QUOTE:
+            self.lines.append(f"> {text}")
+        elif block_type == QUOTE_CONTAINER:
+            start = len(self.lines)
+            self._render_children(block, depth)
+            self.lines[start:] = [f"> {line}" if line else ">" for line in self.lines[start:]]
+            return
+        elif block_type == DIVIDER:
+            self.lines.append("---")
+        elif block_type == IMAGE:
+            image_token = block.get("image", {}).get("token")
+            if image_token:
+                self.lines.append(self._media_placeholder("image", image_token, ""))
+        elif block_type == FILE:
+            file_info = block.get("file", {})
+            file_token = file_info.get("token")
+            file_name = file_info.get("name", "")
+            if file_token and is_image_file(file_name):
+                self.lines.append(self._media_placeholder("file", file_token, file_name))
+            elif file_name:
+                self.lines.append(f"{indent}[附件: {file_name}]")
+        elif block_type == TABLE:
+            self._render_table(block)
+            return
+        elif text:
+            self.lines.append(f"{indent}{text}")
+
+        # 其余容器块（高亮块、分栏等）直接展开子块
+        self._render_children(block, depth)
+
+    def _render_table(self, block: Dict[str, Any]) -> None:
+        prop = block.get("table", {}).get("property", {})
+        column_size = prop.get("column_size") or 1
+        cells = [self._cell_text(cell) for cell in self._children(block)]
+        rows = [cells[i:i + column_size] for i in range(0, len(cells), column_size)]
+        if not rows:
+            return
+
+        self.lines.append("")
+        for i, row in enumerate(rows):
+            row = row + [""] * (column_size - len(row))
+            self.lines.append("| " + " | ".join(row) + " |")
+            if i == 0:
+                self.lines.append("|" + " --- |" * column_size)
+        self.lines.append("")
+
+    def _cell_text(self, cell: Dict[str, Any]) -> str:
+        """单元格内的块合并为一行，图片保留占位符"""
+        renderer_start = len(self.lines)
+        self._render_children(cell, depth=0)
+        cell_lines = [line.strip() for line in self.lines[renderer_start:] if line.strip()]
+        del self.lines[renderer_start:]
+        return " ".join(cell_lines).replace("|", "\\|")
+
+
+def render_document_blocks(blocks: List[Dict[str, Any]]) -> Tuple[str, List[Tuple[str, str, str]]]:
+    """
+    将文档块列表还原为Markdown文本，并按文档顺序收集图片
+
+    参数:
+        blocks: /docx/v1/documents/{id}/blocks 接口返回的全部块
+
+    返回:
+        (带图片占位符的文本, [(类型, 媒体token, 文件名)])，类型为 image 或 file
+    """
+    return _DocumentRenderer(blocks).render()
+
+
+def fill_media_placeholders(text: str, downloaded: List[Optional[Any]]) -> str:
+    """
+    将图片占位符替换为 [图片N]，N为成功下载的图片在发送给模型的图片中的序号
+
+    参数:
+        text: render_document_blocks 生成的文本
+        downloaded: 与媒体列表一一对应的下载结果，失败的项为None
+
+    返回:
+        替换后的文本，下载失败的图片占位符被移除
+    """
+    numbers = {}
+    for index, item in enumerate(downloaded):
+        if item is not None:
+            numbers[index] = len(numbers) + 1
+
+    def replace(match: re.Match) -> str:
+        number = numbers.get(int(match.group(1)))
+        return f"[图片{number}]" if number else ""
+
+    return _MEDIA_PLACEHOLDER_PATTERN.sub(replace, text)
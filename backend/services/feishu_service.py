@@ -1,38 +1,158 @@
+import asyncio
+import os
 import re
+import time
+import uuid
 import httpx
-from typing import Optional, Dict, Any, List, Tuple
+from typing import Optional, Dict, Any, List, Tuple, Union
 from urllib.parse import urlparse
 
+from utils.file_utils import save_uploaded_file
+from .document_cache import FeishuDocumentCache
+from .feishu_blocks import render_document_blocks, fill_media_placeholders
+from .image_preprocessor import IMAGE_SPILL_BYTES
+
+try:
+    import h2  # noqa: F401  httpx 的 HTTP/2 支持依赖 h2
+    HTTP2_AVAILABLE = True
+except ImportError:
+    HTTP2_AVAILABLE = False
 
-class FeishuService:
-    """飞书文档服务类，用于获取飞书文档内容"""
-    def __init__(self, app_id: str, app_secret: str):
 
+class FeishuTokenManager:
+    """租户访问令牌管理器
+
+    记录令牌的过期时间并在过期前主动刷新，
+    并发的刷新请求会合并为一次，避免令牌失效瞬间的请求风暴。
+    """
+
+    def __init__(self, app_id: str, app_secret: str, token_url: str, get_client, refresh_margin: float = None):
         self.app_id = app_id
         self.app_secret = app_secret
-        self.access_token = None
-        self.base_url = "https://open.feishu.cn/open-apis"
+        self.token_url = token_url
+        self._get_client = get_client
+        # 距过期不足该秒数时即刷新
+        self.refresh_margin = refresh_margin or float(os.getenv("FEISHU_TOKEN_REFRESH_MARGIN", "300"))
+        self._token: Optional[str] = None
+        self._expires_at = 0.0
+        self._lock = asyncio.Lock()
 
-    async def get_access_token(self) -> str:
-        if self.access_token:
-            return self.access_token
-            
-        url = f"{self.base_url}/auth/v3/tenant_access_token/internal"
+    def _is_fresh(self) -> bool:
+        return self._token is not None and time.monotonic() < self._expires_at - self.refresh_margin
+
+    async def get_token(self) -> str:
+        """获取有效的访问令牌，必要时刷新"""
+        if self._is_fresh():
+            return self._token
+
+        async with self._lock:
+            # 等待锁期间其他协程可能已经完成刷新
+            if self._is_fresh():
+                return self._token
+            await self._refresh()
+            return self._token
+
+    def invalidate(self, token: str) -> None:
+        """
+        标记令牌已失效，下次获取时重新请求
+
+        只有当前持有的令牌与失效令牌相同时才清除，避免并发重试时重复刷新
+        """
+        if self._token == token:
+            self._token = None
+            self._expires_at = 0.0
+
+    async def _refresh(self) -> None:
         payload = {
             "app_id": self.app_id,
             "app_secret": self.app_secret
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.post(url, json=payload)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data.get("code") == 0:
-                self.access_token = data["tenant_access_token"]
-                return self.access_token
-            else:
-                raise Exception(f"获取访问令牌失败: {data.get('msg')}")
+        requested_at = time.monotonic()
+        response = await self._get_client().post(self.token_url, json=payload)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data.get("code") == 0:
+            self._token = data["tenant_access_token"]
+            self._expires_at = requested_at + float(data.get("expire", 7200))
+        else:
+            raise Exception(f"获取访问令牌失败: {data.get('msg')}")
+
+
+class FeishuService:
+    """飞书文档服务类，用于获取飞书文档内容"""
+
+    # 访问令牌无效或过期时返回的错误码
+    TOKEN_INVALID_CODES = {99991661, 99991663, 99991668}
+
+    def __init__(self, app_id: str, app_secret: str, media_concurrency: int = None, media_timeout: float = None):
+
+        self.app_id = app_id
+        self.app_secret = app_secret
+        self.base_url = "https://open.feishu.cn/open-apis"
+        # 媒体文件并发下载数和单个文件的超时时间（秒）
+        self.media_concurrency = media_concurrency or int(os.getenv("FEISHU_MEDIA_CONCURRENCY", "8"))
+        self.media_timeout = media_timeout or float(os.getenv("FEISHU_MEDIA_TIMEOUT", "60"))
+        # 所有请求共用一个带连接池的HTTP客户端，避免重复建立TCP和TLS连接
+        self.max_connections = int(os.getenv("FEISHU_MAX_CONNECTIONS", "20"))
+        self.http2 = os.getenv("FEISHU_HTTP2", "true").lower() in ("1", "true", "yes") and HTTP2_AVAILABLE
+        self._client: Optional[httpx.AsyncClient] = None
+        self.token_manager = FeishuTokenManager(
+            app_id,
+            app_secret,
+            f"{self.base_url}/auth/v3/tenant_access_token/internal",
+            self._get_client
+        )
+        # 按文档修订版本缓存解析后的文本和媒体文件
+        self.document_cache = FeishuDocumentCache()
+
+    def _get_client(self) -> httpx.AsyncClient:
+        """获取共享的HTTP客户端，首次使用或关闭后重新创建"""
+        if self._client is None or self._client.is_closed:
+            self._client = httpx.AsyncClient(
+                http2=self.http2,
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_connections,
+                    keepalive_expiry=60.0
+                )
+            )
+        return self._client
+
+    async def aclose(self) -> None:
+        """关闭共享的HTTP客户端和文档缓存"""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.document_cache.close()
+
+    async def get_access_token(self) -> str:
+        """获取租户访问令牌"""
+        return await self.token_manager.get_token()
+
+    async def _request(self, method: str, url: str, **kwargs) -> httpx.Response:
+        """携带访问令牌发送请求，令牌失效时刷新后重试一次"""
+        extra_headers = kwargs.pop("headers", {})
+        for attempt in range(2):
+            access_token = await self.get_access_token()
+            headers = {**extra_headers, "Authorization": f"Bearer {access_token}"}
+            response = await self._get_client().request(method, url, headers=headers, **kwargs)
+            if attempt == 0 and self._is_token_invalid(response):
+                print("飞书访问令牌已失效，刷新后重试")
+                self.token_manager.invalidate(access_token)
+                continue
+            return response
+        return response
+
+    def _is_token_invalid(self, response: httpx.Response) -> bool:
+        """判断响应是否表示访问令牌无效"""
+        if not response.headers.get("content-type", "").startswith("application/json"):
+            return False
+        try:
+            return response.json().get("code") in self.TOKEN_INVALID_CODES
+        except ValueError:
+            return False
     
     def parse_feishu_url(self, url: str) -> Dict[str, Any]:
         """解析飞书文档URL，提取文档ID和类型
@@ -71,9 +191,6 @@ class FeishuService:
         doc_type = doc_info["type"]
         doc_id = doc_info["id"]
         
-        # 获取访问令牌
-        access_token = await self.get_access_token()
-        
         # 根据文档类型选择对应的API
         if doc_type == "docx":
             # 新版文档API
@@ -83,195 +200,167 @@ class FeishuService:
             api_url = f"{self.base_url}/doc/v2/{doc_id}/raw_content"
         
         headers = {
-            "Authorization": f"Bearer {access_token}",
             "Content-Type": "application/json"
         }
         
-        async with httpx.AsyncClient() as client:
-            response = await client.get(api_url, headers=headers)
-            response.raise_for_status()
-            
-            data = response.json()
-            if data.get("code") == 0:
-                return data.get("data", {}).get("content", "")
-            else:
-                raise Exception(f"获取文档内容失败: {data.get('msg')}")
+        response = await self._request("GET", api_url, headers=headers)
+        response.raise_for_status()
+        
+        data = response.json()
+        if data.get("code") == 0:
+            return data.get("data", {}).get("content", "")
+        else:
+            raise Exception(f"获取文档内容失败: {data.get('msg')}")
     
-    async def get_document_multimodal_content(self, url: str) -> Tuple[str, List[str]]:
+    async def get_document_multimodal_content(self, url: str) -> Tuple[str, List[Union[bytes, str]]]:
         """获取飞书文档的多模态内容（文本+图片）
+
+        图片以内存中的字节返回，只有超过落盘阈值的图片才保存到uploads目录并返回路径
         """
         # 解析URL获取文档信息
         doc_info = self.parse_feishu_url(url)
         doc_type = doc_info["type"]
         doc_id = doc_info["id"]
         
-        # 获取访问令牌
-        access_token = await self.get_access_token()
+        # 文档未修改时直接使用本地缓存
+        revision_id = None
+        if doc_type == "docx" and self.document_cache.enabled:
+            revision_id = await self._get_document_revision(doc_id)
+            if revision_id is not None:
+                cached = await asyncio.to_thread(self.document_cache.get, doc_id, revision_id)
+                if cached is not None:
+                    print(f"命中飞书文档缓存: {doc_id}（版本 {revision_id}）")
+                    text_content, media = cached
+                    return text_content, await self._handoff_media(media)
         
-        # 先获取文本内容
-        text_content = await self.get_document_content(url)
-        
-        # 获取文档结构化内容以提取图片
-        images = []
-        try:
-            if doc_type == "docx":
-                # 新版文档API - 获取文档所有块
-                blocks_url = f"{self.base_url}/docx/v1/documents/{doc_id}/blocks"
-                headers = {
-                    "Authorization": f"Bearer {access_token}",
-                    "Content-Type": "application/json"
-                }
-                
-                # 分页获取所有块
-                page_token = None
-                while True:
-                    params = {"page_size": 500}
-                    if page_token:
-                        params["page_token"] = page_token
-                    
-                    async with httpx.AsyncClient() as client:
-                        response = await client.get(blocks_url, headers=headers, params=params)
-                        if response.status_code == 200:
-                            data = response.json()
-                            if data.get("code") == 0:
-                                blocks = data.get("data", {}).get("items", [])
-                                
-                                # 遍历文档块，查找图片和文件
-                                for block in blocks:
-                                    block_type = block.get("block_type")
-                                    
-                                    # 处理图片块 (block_type = 27)
-                                    if block_type == 27:
-                                        image_info = block.get("image", {})
-                                        image_token = image_info.get("token")
-                                        
-                                        if image_token:
-                                            # 下载图片并保存到文件系统
-                                            image_path = await self._download_and_save_image(access_token, image_token)
-                                            if image_path:
-                                                images.append(image_path)
-                                    
-                                    # 处理文件块 (block_type = 23) - 可能包含图片文件
-                                    elif block_type == 23:
-                                        file_info = block.get("file", {})
-                                        file_token = file_info.get("token")
-                                        file_name = file_info.get("name", "")
-                                        
-                                        # 检查是否为图片文件
-                                        if file_token and self._is_image_file(file_name):
-                                            # 下载图片文件并保存到文件系统
-                                            image_path = await self._download_and_save_file_as_image(access_token, file_token, file_name)
-                                            if image_path:
-                                                images.append(image_path)
-                                
-                                # 检查是否还有更多页
-                                if not data.get("data", {}).get("has_more", False):
-                                    break
-                                page_token = data.get("data", {}).get("page_token")
-                            else:
-                                print(f"获取文档块失败: {data.get('msg')}")
-                                break
-                        else:
-                            print(f"请求文档块失败: {response.status_code}")
-                            break
+        media = []
+        media_complete = False
+        if doc_type == "docx":
+            # 一次遍历文档块，同时还原结构化文本并定位图片，无需再请求raw_content
+            try:
+                blocks = await self._fetch_blocks(doc_id)
+                text_content, media_items = render_document_blocks(blocks)
+            except Exception as e:
+                print(f"获取文档块失败，改用纯文本内容: {e}")
+                return await self.get_document_content(url), []
             
+            # 统一并发下载图片
+            downloaded = await self._download_media_items(media_items)
+            text_content = fill_media_placeholders(text_content, downloaded)
+            media = [item for item in downloaded if item is not None]
+            media_complete = len(media) == len(downloaded)
+        else:
             # 注意：旧版文档(doc)的图片获取较为复杂，这里暂时只处理新版文档
-            
-        except Exception as e:
-            # 如果获取图片失败，只返回文本内容
-            print(f"获取文档图片失败: {e}")
+            text_content = await self.get_document_content(url)
         
-        return text_content, images
-    
-    def _is_image_file(self, filename: str) -> bool:
-        """检查文件是否为图片文件
-        """
-        if not filename:
-            return False
+        # 只缓存媒体全部下载成功的结果，避免缺图的内容被长期复用
+        if revision_id is not None and media_complete:
+            await asyncio.to_thread(self.document_cache.set, doc_id, revision_id, text_content, media)
         
-        image_extensions = {'.jpg', '.jpeg', '.png', '.gif', '.bmp', '.webp', '.svg'}
-        file_ext = filename.lower().split('.')[-1] if '.' in filename else ''
-        return f'.{file_ext}' in image_extensions
+        return text_content, await self._handoff_media(media)
     
-    async def _download_and_save_image(self, access_token: str, image_token: str) -> Optional[str]:
-        """下载文档中的图片并保存到文件系统
-        
-        Args:
-            access_token: 访问令牌
-            image_token: 图片token
-            
+    async def _get_document_revision(self, doc_id: str) -> Optional[int]:
+        """获取新版文档当前的修订版本号，失败时返回None"""
+        try:
+            response = await self._request("GET", f"{self.base_url}/docx/v1/documents/{doc_id}")
+            data = response.json()
+            if response.status_code == 200 and data.get("code") == 0:
+                return data.get("data", {}).get("document", {}).get("revision_id")
+            print(f"获取文档版本失败: {data.get('msg')}")
+        except Exception as e:
+            print(f"获取文档版本失败: {e}")
+        return None
+    
+    async def _fetch_blocks(self, doc_id: str) -> List[Dict[str, Any]]:
+        """分页获取新版文档的所有块
+
         Returns:
-            Optional[str]: 图片文件路径
+            List[Dict[str, Any]]: 按文档顺序排列的块列表
         """
-        try:
-            # 下载图片字节数据
-            image_data = await self._download_media(access_token, image_token)
-            if not image_data:
-                return None
-            
-            # 生成唯一的文件名
-            import uuid
-            import os
-            image_id = str(uuid.uuid4())
-            image_path = f"uploads/feishu_image_{image_id}.png"  # 默认使用png格式
+        blocks_url = f"{self.base_url}/docx/v1/documents/{doc_id}/blocks"
+        headers = {
+            "Content-Type": "application/json"
+        }
+        
+        blocks = []
+        page_token = None
+        while True:
+            params = {"page_size": 500}
+            if page_token:
+                params["page_token"] = page_token
             
-            # 确保uploads目录存在
-            os.makedirs("uploads", exist_ok=True)
+            response = await self._request("GET", blocks_url, headers=headers, params=params)
+            if response.status_code != 200:
+                raise Exception(f"请求文档块失败: {response.status_code}")
             
-            # 保存图片到文件系统
-            with open(image_path, "wb") as f:
-                f.write(image_data)
+            data = response.json()
+            if data.get("code") != 0:
+                raise Exception(f"获取文档块失败: {data.get('msg')}")
             
-            print(f"成功保存飞书图片到: {image_path}")
-            return image_path
+            blocks.extend(data.get("data", {}).get("items", []))
             
-        except Exception as e:
-            print(f"保存图片失败: {e}")
-            return None
+            # 检查是否还有更多页
+            if not data.get("data", {}).get("has_more", False):
+                break
+            page_token = data.get("data", {}).get("page_token")
+        
+        return blocks
     
-    async def _download_and_save_file_as_image(self, access_token: str, file_token: str, filename: str) -> Optional[str]:
-        """下载文档中的文件（图片）并保存到文件系统
+    async def _download_media_items(self, media_items: List[Tuple[str, str, str]]) -> List[Optional[Tuple[str, str, bytes]]]:
+        """以有限并发下载媒体文件，结果与文档中的顺序一致
         
         Args:
-            access_token: 访问令牌
-            file_token: 文件token
-            filename: 原始文件名
+            media_items: render_document_blocks 收集的媒体列表
             
         Returns:
-            Optional[str]: 图片文件路径
+            List[Optional[Tuple[str, str, bytes]]]: (文件名前缀, 扩展名, 媒体字节) 列表，下载失败的项为None
         """
-        try:
-            # 下载文件字节数据
-            file_data = await self._download_media(access_token, file_token)
-            if not file_data:
+        semaphore = asyncio.Semaphore(self.media_concurrency)
+        
+        async def download(kind: str, token: str, filename: str) -> Optional[Tuple[str, str, bytes]]:
+            async with semaphore:
+                try:
+                    data = await asyncio.wait_for(self._download_media(token), timeout=self.media_timeout)
+                except asyncio.TimeoutError:
+                    print(f"下载媒体文件超时: {token}")
+                    return None
+            if not data:
                 return None
-            
-            # 生成唯一的文件名，保留原始扩展名
-            import uuid
-            import os
-            image_id = str(uuid.uuid4())
-            file_ext = filename.split('.')[-1] if '.' in filename else 'png'
-            image_path = f"uploads/feishu_file_{image_id}.{file_ext}"
-            
-            # 确保uploads目录存在
-            os.makedirs("uploads", exist_ok=True)
-            
-            # 保存文件到文件系统
-            with open(image_path, "wb") as f:
-                f.write(file_data)
-            
-            print(f"成功保存飞书文件图片到: {image_path}")
-            return image_path
-            
-        except Exception as e:
-            print(f"保存文件图片失败: {e}")
-            return None
+            if kind == "image":
+                return "feishu_image", "png", data  # 默认使用png格式
+            # 保留原始扩展名
+            return "feishu_file", filename.split('.')[-1] if '.' in filename else 'png', data
+        
+        return await asyncio.gather(*[download(*item) for item in media_items])
     
-    async def _download_media(self, access_token: str, media_token: str) -> Optional[bytes]:
+    async def _handoff_media(self, media: List[Tuple[str, str, bytes]]) -> List[Union[bytes, str]]:
+        """按顺序交出媒体内容，超过落盘阈值的写入uploads目录后以路径代替"""
+        images = []
+        for item in media:
+            if len(item[2]) > IMAGE_SPILL_BYTES:
+                images.extend(await self._save_media([item]))
+            else:
+                images.append(item[2])
+        return images
+
+    async def _save_media(self, media: List[Tuple[str, str, bytes]]) -> List[str]:
+        """将媒体文件保存到uploads目录，返回文件路径列表"""
+        image_paths = []
+        for prefix, file_ext, data in media:
+            try:
+                image_path = await asyncio.to_thread(
+                    save_uploaded_file, data, "uploads", f"{prefix}_{uuid.uuid4()}.{file_ext}"
+                )
+                print(f"成功保存飞书图片到: {image_path}")
+                image_paths.append(image_path)
+            except Exception as e:
+                print(f"保存图片失败: {e}")
+        return image_paths
+    
+    async def _download_media(self, media_token: str) -> Optional[bytes]:
         """下载文档中的媒体文件（图片或文件）
         
         Args:
-            access_token: 访问令牌
             media_token: 媒体token（图片token或文件token）
             
         Returns:
@@ -280,17 +369,12 @@ class FeishuService:
         try:
             # 飞书API下载素材接口
             media_url = f"{self.base_url}/drive/v1/medias/{media_token}/download"
-            headers = {
-                "Authorization": f"Bearer {access_token}"
-            }
-            
-            async with httpx.AsyncClient(timeout=30.0) as client:
-                # 下载媒体文件
-                response = await client.get(media_url, headers=headers)
-                if response.status_code == 200:
-                    return response.content
-                else:
-                    print(f"下载媒体文件失败，状态码: {response.status_code}")
+            # 下载媒体文件
+            response = await self._request("GET", media_url, timeout=30.0)
+            if response.status_code == 200:
+                return response.content
+            else:
+                print(f"下载媒体文件失败，状态码: {response.status_code}")
             
             return None
         except Exception as e:
@@ -0,0 +1,102 @@
+import os
+import zlib
+import hashlib
+from typing import List, Optional, Union
+
+import diskcache
+
+
+class GenerationCache:
+    """测试用例生成结果缓存
+
+    以PRD文本、图片内容、上下文、特殊要求、系统消息和模型名称的哈希作为键，
+    将生成的Markdown压缩后保存在磁盘上（基于SQLite的diskcache），
+    支持按总大小和过期时间淘汰。
+    """
+
+    def __init__(self, directory: str = None, size_limit_mb: int = None, ttl_hours: float = None, enabled: bool = None):
+        self.directory = directory or os.getenv("GENERATION_CACHE_DIR", "cache/generations")
+        self.size_limit = (size_limit_mb or int(os.getenv("GENERATION_CACHE_SIZE_MB", "512"))) * 1024 * 1024
+        self.ttl_seconds = (ttl_hours or float(os.getenv("GENERATION_CACHE_TTL_HOURS", "168"))) * 3600
+        if enabled is None:
+            enabled = os.getenv("GENERATION_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+        self.enabled = enabled
+        self._cache = diskcache.Cache(self.directory, size_limit=self.size_limit) if self.enabled else None
+
+    def make_key(
+        self,
+        prd_text: str,
+        prd_images: List[Union[bytes, str]],
+        context: str,
+        requirements: str,
+        system_message: str,
+        model_name: str,
+        variant: str = ""
+    ) -> str:
+        """
+        计算生成请求的内容哈希
+
+        参数:
+            prd_text: PRD文本
+            prd_images: 图片字节或文件路径列表，按内容而非路径参与哈希
+            context: 上下文信息
+            requirements: 特殊要求
+            system_message: 系统消息
+            model_name: 模型名称
+            variant: 生成方式（如分章节生成），不同方式的结果分别缓存
+
+        返回:
+            十六进制的SHA-256摘要
+        """
+        digest = hashlib.sha256()
+
+        def update_field(value: bytes) -> None:
+            # 写入长度前缀，避免不同字段拼接后产生歧义
+            digest.update(len(value).to_bytes(8, "big"))
+            digest.update(value)
+
+        fields = (model_name, system_message, prd_text, context, requirements)
+        if variant:
+            # 默认生成方式不写入该字段，保持已有缓存键不变
+            fields += (variant,)
+        for field in fields:
+            update_field((field or "").encode("utf-8"))
+
+        for image in prd_images:
+            image_digest = hashlib.sha256()
+            if isinstance(image, bytes):
+                image_digest.update(image)
+            elif os.path.exists(image):
+                with open(image, "rb") as f:
+                    for block in iter(lambda: f.read(1024 * 1024), b""):
+                        image_digest.update(block)
+            update_field(image_digest.digest())
+
+        return digest.hexdigest()
+
+    def get(self, key: str) -> Optional[str]:
+        """读取缓存的Markdown，未命中时返回None"""
+        if not self.enabled:
+            return None
+        try:
+            data = self._cache.get(key)
+            if data is None:
+                return None
+            return zlib.decompress(data).decode("utf-8")
+        except Exception as e:
+            print(f"读取生成缓存失败: {e}")
+            return None
+
+    def set(self, key: str, markdown_text: str) -> None:
+        """压缩并写入生成的Markdown"""
+        if not self.enabled:
+            return
+        try:
+            self._cache.set(key, zlib.compress(markdown_text.encode("utf-8")), expire=self.ttl_seconds)
+        except Exception as e:
+            print(f"写入生成缓存失败: {e}")
+
+    def close(self) -> None:
+        """关闭底层存储"""
+        if self._cache is not None:
+            self._cache.close()
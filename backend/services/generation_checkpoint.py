@@ -0,0 +1,135 @@
+import re
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+"""这个模块负责可续写生成的检查点：记录已完整输出的测试用例，
+并把上游中断后续写的输出拼接到最后一个检查点之后。"""
+
+# 每个用例开始前的检查点标记；续写时输出续写标记，前端和解析器丢弃最后一个检查点之后的内容
+CHECKPOINT_MARKER = "<!-- CHECKPOINT -->\n"
+RESUME_MARKER = "<!-- RESUME -->\n"
+
+
+def _title_key(title: str) -> str:
+    """忽略空白和标点后的标题，用于识别续写时重复生成的用例"""
+    return re.sub(r"[\s\W_]+", "", title or "").lower()
+
+
+class GenerationCheckpoint:
+    """可续写生成的检查点
+
+    逐块接收模型输出的Markdown并立即转发，只有可能是用例标题（## 开头）的行首会缓冲到整行到达；
+    每个用例标题前插入检查点标记，上一个用例在下一个用例开始或输出结束时记为已完成。
+    中断续写后，续写输出中用例之前的说明文字被丢弃，与已完成用例标题相同的用例被跳过，其余用例接续编号。
+    """
+
+    def __init__(self):
+        self.completed: List[str] = []
+        self.attempt = 0
+        self._titles: Set[str] = set()
+        self._current: Optional[Tuple[str, str]] = None
+        self._line = ""
+        self._line_forwarded = False
+        self._skipping = False
+        self._case_seen = False
+        self._forwarded = False
+
+    @property
+    def last_id(self) -> Optional[str]:
+        """最后一个已完成用例的ID"""
+        return self.completed[-1].split(": ", 1)[0] if self.completed else None
+
+    def feed(self, text: str) -> List[str]:
+        """
+        输入一段模型输出的Markdown
+
+        返回:
+            应转发的文本片段列表，检查点标记作为单独的片段
+        """
+        output: List[str] = []
+        self._line += text
+        while True:
+            newline = self._line.find("\n")
+            if newline < 0:
+                break
+            line, self._line = self._line[:newline + 1], self._line[newline + 1:]
+            output.extend(self._process_line(line))
+            self._line_forwarded = False
+
+        # 不可能是用例标题的行首立即转发，不必等待整行
+        if self._line and (self._line_forwarded or not (self._line.startswith("## ") or "## ".startswith(self._line))):
+            output.extend(self._process_line(self._line))
+            self._line = ""
+            self._line_forwarded = True
+        return output
+
+    def add_case(self, test_case: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """
+        记录结构化输出的一个完整用例
+
+        返回:
+            应转发的用例，续写时重新编号；与已完成用例重复时返回None
+        """
+        title = test_case.get("title", "")
+        if self.attempt > 0:
+            if _title_key(title) in self._titles:
+                return None
+            test_case = {**test_case, "id": f"TC-{len(self.completed) + 1:03d}"}
+        self._current = (test_case["id"], title)
+        self._commit()
+        self._forwarded = True
+        return test_case
+
+    def close(self) -> List[str]:
+        """输出正常结束，转发缓冲的文本并将最后一个用例记为已完成"""
+        output: List[str] = []
+        if self._line:
+            output.extend(self._process_line(self._line))
+            self._line = ""
+        self._commit()
+        return output
+
+    def resume(self) -> None:
+        """开始一次续写，丢弃未完成的用例"""
+        self.attempt += 1
+        self._current = None
+        self._line = ""
+        self._line_forwarded = False
+        self._skipping = False
+        self._case_seen = False
+
+    def _process_line(self, line: str) -> List[str]:
+        if not self._line_forwarded and line.startswith("## "):
+            return self._start_case(line)
+        # 续写时跳过重复用例的内容，以及已有输出时用例之前的说明文字
+        if self._skipping or (self.attempt > 0 and not self._case_seen and self._forwarded):
+            return []
+        self._forwarded = True
+        return [line]
+
+    def _start_case(self, line: str) -> List[str]:
+        heading_parts = line[3:].strip().split(": ", 1)
+        title = heading_parts[-1].strip()
+        self._commit()
+        self._case_seen = True
+
+        self._skipping = self.attempt > 0 and _title_key(title) in self._titles
+        if self._skipping:
+            return []
+
+        if self.attempt > 0:
+            case_id = f"TC-{len(self.completed) + 1:03d}"
+            line = f"## {case_id}: {title}" + ("\n" if line.endswith("\n") else "")
+        elif len(heading_parts) > 1:
+            case_id = heading_parts[0].strip()
+        else:
+            case_id = f"TC-{len(self.completed) + 1}"
+        self._current = (case_id, title)
+        self._forwarded = True
+        return [CHECKPOINT_MARKER, line]
+
+    def _commit(self) -> None:
+        if self._current is not None:
+            case_id, title = self._current
+            self.completed.append(f"{case_id}: {title}")
+            self._titles.add(_title_key(title))
+            self._current = None
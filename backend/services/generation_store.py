@@ -0,0 +1,55 @@
+import os
+import time
+import uuid
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+
+class GenerationStore:
+    """生成结果暂存
+
+    按生成ID在内存中保留每次生成解析出的测试用例，供导出接口直接使用，
+    前端无需回传整份用例数据；条目按过期时间和数量上限淘汰。
+    """
+
+    def __init__(self, ttl_minutes: float = None, max_entries: int = None):
+        self.ttl_seconds = (ttl_minutes or float(os.getenv("GENERATION_RESULT_TTL_MINUTES", "60"))) * 60
+        self.max_entries = max_entries or int(os.getenv("GENERATION_RESULT_MAX_ENTRIES", "256"))
+        self._entries: "OrderedDict[str, Tuple[float, List[Dict[str, Any]]]]" = OrderedDict()
+
+    def put(self, test_cases: List[Dict[str, Any]]) -> str:
+        """
+        保存一次生成的测试用例
+
+        参数:
+            test_cases: 解析出的测试用例列表
+
+        返回:
+            生成ID
+        """
+        self._evict()
+        generation_id = uuid.uuid4().hex
+        self._entries[generation_id] = (time.monotonic() + self.ttl_seconds, test_cases)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return generation_id
+
+    def get(self, generation_id: str) -> Optional[List[Dict[str, Any]]]:
+        """读取生成ID对应的测试用例，不存在或已过期时返回None"""
+        entry = self._entries.get(generation_id)
+        if entry is None:
+            return None
+        expires_at, test_cases = entry
+        if time.monotonic() >= expires_at:
+            del self._entries[generation_id]
+            return None
+        return test_cases
+
+    def _evict(self) -> None:
+        """淘汰已过期的条目，条目按写入顺序排列，遇到未过期的即可停止"""
+        now = time.monotonic()
+        while self._entries:
+            generation_id, (expires_at, _) = next(iter(self._entries.items()))
+            if expires_at > now:
+                break
+            del self._entries[generation_id]
@@ -0,0 +1,212 @@
+import asyncio
+import base64
+import os
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from io import BytesIO
+from typing import List, Optional, Tuple, Union
+
+from autogen_core import Image as AGImage
+from PIL import Image as PILImage, ImageOps
+
+# 图片来源：内存中的字节或磁盘上的文件路径
+ImageSource = Union[bytes, str]
+
+# 超过该大小的图片才落盘，其余以字节直接交给预处理流水线
+IMAGE_SPILL_BYTES = int(os.getenv("IMAGE_SPILL_THRESHOLD_MB", "8")) * 1024 * 1024
+
+
+class EncodedImage(AGImage):
+    """保留预处理后编码字节的图片
+
+    autogen 的 Image 在发送前总是重新编码为PNG，
+    这里直接使用预处理阶段压缩好的字节，避免请求体膨胀。
+    不调用基类构造函数：基类会把图片完整解码并转换为RGB，在事件循环上重复一次解码；
+    这里的 image 只是延迟打开的图片对象，读取像素时才会解码。
+    """
+
+    def __init__(self, encoded: bytes):
+        self.encoded = encoded
+        self.image = PILImage.open(BytesIO(encoded))
+
+    def to_base64(self) -> str:
+        return base64.b64encode(self.encoded).decode("utf-8")
+
+
+def _difference_hash(image: PILImage.Image, hash_size: int = 8) -> Tuple[int, int]:
+    """
+    计算图片的差值感知哈希（dHash）和平均亮度，用于识别重复图片
+
+    纯色或接近纯色的图片dHash都接近0，需要结合平均亮度区分
+    """
+    small = image.convert("L").resize((hash_size + 1, hash_size), PILImage.Resampling.LANCZOS)
+    pixels = list(small.getdata())
+    value = 0
+    for row in range(hash_size):
+        offset = row * (hash_size + 1)
+        for col in range(hash_size):
+            value = (value << 1) | (pixels[offset + col] > pixels[offset + col + 1])
+    return value, sum(pixels) // len(pixels)
+
+
+def _preprocess_image(source: ImageSource, max_edge: int, image_format: str, quality: int) -> Optional[Tuple[bytes, Tuple[int, int]]]:
+    """
+    在工作进程中处理单张图片：校正方向、缩放长边、去除元数据并重新编码
+
+    参数:
+        source: 图片字节或文件路径
+        max_edge: 长边的最大像素数
+        image_format: 输出格式（JPEG、WEBP 或 PNG）
+        quality: 有损格式的压缩质量
+
+    返回:
+        (编码后的字节, (感知哈希, 平均亮度))，图片无效时返回None
+    """
+    with PILImage.open(BytesIO(source) if isinstance(source, bytes) else source) as pil_image:
+        if pil_image.size[0] <= 0 or pil_image.size[1] <= 0:
+            return None
+
+        image = ImageOps.exif_transpose(pil_image)
+        image.thumbnail((max_edge, max_edge), PILImage.Resampling.LANCZOS)
+
+        if image_format in ("JPEG", "WEBP") and image.mode in ("RGBA", "LA", "P"):
+            # 有损格式不保留透明通道，合成到白色背景上
+            rgba = image.convert("RGBA")
+            background = PILImage.new("RGB", rgba.size, (255, 255, 255))
+            background.paste(rgba, mask=rgba.split()[-1])
+            image = background
+        elif image.mode not in ("RGB", "L", "RGBA"):
+            image = image.convert("RGB")
+
+        # 只写入像素数据，不携带EXIF、ICC等元数据
+        buffer = BytesIO()
+        save_kwargs = {"optimize": True}
+        if image_format in ("JPEG", "WEBP"):
+            save_kwargs["quality"] = quality
+        image.save(buffer, format=image_format, **save_kwargs)
+
+        return buffer.getvalue(), _difference_hash(image)
+
+
+class ImagePreprocessor:
+    """发送给视觉模型前的图片预处理流水线
+
+    在进程池中并行缩放、重新编码并去除元数据，
+    再按感知哈希剔除重复图片，降低请求体积和模型Token开销；
+    工作进程异常退出（如解码超大图片时被OOM终止）导致进程池损坏时，重建进程池并重试一次。
+    """
+
+    def __init__(
+        self,
+        max_edge: int = None,
+        image_format: str = None,
+        quality: int = None,
+        dedupe_distance: int = None,
+        max_workers: int = None
+    ):
+        self.max_edge = max_edge or int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+        self.image_format = (image_format or os.getenv("IMAGE_FORMAT", "JPEG")).upper()
+        self.quality = quality or int(os.getenv("IMAGE_QUALITY", "85"))
+        # 感知哈希的汉明距离不超过该值即视为重复，小于0时不去重
+        self.dedupe_distance = dedupe_distance if dedupe_distance is not None else int(os.getenv("IMAGE_DEDUPE_DISTANCE", "4"))
+        self.max_workers = max_workers or int(os.getenv("IMAGE_PREPROCESS_WORKERS", str(min(4, os.cpu_count() or 1))))
+        self._executor: Optional[ProcessPoolExecutor] = None
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    def _reset_executor(self, executor: ProcessPoolExecutor) -> None:
+        """丢弃已损坏的进程池，下次使用时重新创建"""
+        if self._executor is executor:
+            self._executor = None
+            executor.shutdown(wait=False, cancel_futures=True)
+            print("图片预处理进程池已损坏，重新创建")
+
+    async def _run_batch(self, sources: List[ImageSource], max_edge: int) -> List:
+        """在进程池中处理一批图片，返回结果或异常的列表；进程池损坏时将其丢弃"""
+        loop = asyncio.get_running_loop()
+        executor = self._get_executor()
+        futures = []
+        for source in sources:
+            try:
+                futures.append(
+                    loop.run_in_executor(executor, _preprocess_image, source, max_edge, self.image_format, self.quality)
+                )
+            except BrokenProcessPool as e:
+                future = loop.create_future()
+                future.set_exception(e)
+                futures.append(future)
+
+        results = await asyncio.gather(*futures, return_exceptions=True)
+        if any(isinstance(result, BrokenProcessPool) for result in results):
+            self._reset_executor(executor)
+        return results
+
+    async def prepare(self, images: List[ImageSource], max_edge: int = None) -> List[AGImage]:
+        """
+        预处理一组图片，返回可直接放入多模态消息的图片对象
+
+        参数:
+            images: 图片字节或文件路径的列表，内存中的图片无需落盘即可处理
+            max_edge: 本次处理的长边上限，默认使用配置值，超出Token预算时可调小
+
+        返回:
+            按原顺序排列、已去重的图片对象列表
+        """
+        max_edge = max_edge or self.max_edge
+
+        sources = []
+        for i, source in enumerate(images):
+            label = f"第{i+1}张图片" if isinstance(source, bytes) else source
+            if isinstance(source, bytes) or os.path.exists(source):
+                sources.append((label, source))
+            else:
+                print(f"跳过第{i+1}张图片：文件不存在 {source}")
+
+        results = await self._run_batch([source for _, source in sources], max_edge)
+        broken = [i for i, result in enumerate(results) if isinstance(result, BrokenProcessPool)]
+        if broken:
+            # 进程池损坏时尚未完成的图片都会失败，用新进程池重试一次
+            retried = await self._run_batch([sources[i][1] for i in broken], max_edge)
+            for i, result in zip(broken, retried):
+                results[i] = result
+
+        ag_images = []
+        seen_hashes: List[Tuple[int, int]] = []
+        for (label, _), result in zip(sources, results):
+            if isinstance(result, BaseException):
+                print(f"处理图片 {label} 时出错: {result}")
+                continue
+            if result is None:
+                print(f"跳过无效图片: {label}")
+                continue
+
+            encoded, image_hash = result
+            if self.dedupe_distance >= 0 and any(
+                self._is_duplicate(image_hash, seen) for seen in seen_hashes
+            ):
+                print(f"跳过重复图片: {label}")
+                continue
+            seen_hashes.append(image_hash)
+
+            ag_images.append(EncodedImage(encoded))
+            print(f"成功处理图片: {label}（{len(encoded) // 1024}KB）")
+
+        return ag_images
+
+    def _is_duplicate(self, image_hash: Tuple[int, int], seen: Tuple[int, int]) -> bool:
+        """感知哈希的汉明距离和平均亮度都足够接近时视为重复图片"""
+        difference, brightness = image_hash
+        seen_difference, seen_brightness = seen
+        return (
+            bin(difference ^ seen_difference).count("1") <= self.dedupe_distance
+            and abs(brightness - seen_brightness) <= 8
+        )
+
+    def shutdown(self) -> None:
+        """关闭进程池"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
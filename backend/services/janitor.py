@@ -0,0 +1,108 @@
+import asyncio
+import os
+import time
+from typing import Any, Dict, Optional
+
+from utils.file_utils import clean_old_files
+from .result_store import result_store
+from .export_jobs import export_job_manager
+
+
+class FileJanitor:
+    """磁盘清理任务
+
+    在后台定期清理uploads目录（上传的图片和飞书文档下载的图片）和results目录（导出文件），
+    按保留时间和目录总大小两种配额删除最旧的文件，并累计释放的空间；
+    jobs目录中已结束的导出任务记录按导出文件的保留时间删除。
+    """
+
+    def __init__(
+        self,
+        interval_seconds: float = None,
+        uploads_dir: str = "uploads",
+        uploads_max_age_hours: float = None,
+        uploads_max_total_mb: int = None
+    ):
+        self.interval_seconds = interval_seconds or float(os.getenv("JANITOR_INTERVAL_SECONDS", "600"))
+        self.uploads_dir = uploads_dir
+        self.uploads_max_age_hours = uploads_max_age_hours or float(os.getenv("UPLOADS_MAX_AGE_HOURS", "24"))
+        self.uploads_max_total_bytes = (uploads_max_total_mb or int(os.getenv("UPLOADS_MAX_TOTAL_MB", "2048"))) * 1024 * 1024
+        self._task: Optional[asyncio.Task] = None
+        self._metrics = {
+            "sweeps": 0,
+            "failed_sweeps": 0,
+            "files_removed": 0,
+            "bytes_reclaimed": 0,
+            "uploads_bytes_reclaimed": 0,
+            "results_bytes_reclaimed": 0,
+            "job_records_removed": 0,
+            "last_sweep_at": None,
+            "last_sweep_seconds": 0.0,
+        }
+
+    def _sweep_uploads(self) -> None:
+        removed, reclaimed = clean_old_files(
+            self.uploads_dir,
+            max_age_days=self.uploads_max_age_hours / 24,
+            max_total_bytes=self.uploads_max_total_bytes
+        )
+        self._metrics["files_removed"] += len(removed)
+        self._metrics["uploads_bytes_reclaimed"] += reclaimed
+        self._metrics["bytes_reclaimed"] += reclaimed
+
+    def _sweep_orphan_results(self, exclude) -> None:
+        # 清理未在结果索引中登记的遗留文件
+        removed, reclaimed = clean_old_files(
+            result_store.directory,
+            max_age_days=result_store.max_age_seconds / (24 * 3600),
+            exclude=exclude
+        )
+        self._metrics["files_removed"] += len(removed)
+        self._metrics["results_bytes_reclaimed"] += reclaimed
+        self._metrics["bytes_reclaimed"] += reclaimed
+
+    async def sweep(self) -> None:
+        """执行一次清理，目录遍历和删除在线程中进行"""
+        started_at = time.monotonic()
+        reclaimed_before = self._metrics["bytes_reclaimed"]
+        try:
+            await asyncio.to_thread(self._sweep_uploads)
+            # 结果索引只在事件循环线程中修改，索引内的文件按其配额淘汰
+            reclaimed = result_store.prune()
+            self._metrics["results_bytes_reclaimed"] += reclaimed
+            self._metrics["bytes_reclaimed"] += reclaimed
+            await asyncio.to_thread(self._sweep_orphan_results, result_store.reserved_names())
+            self._metrics["job_records_removed"] += await asyncio.to_thread(export_job_manager.prune)
+        except Exception as e:
+            self._metrics["failed_sweeps"] += 1
+            print(f"磁盘清理失败: {str(e)}")
+            return
+        self._metrics["sweeps"] += 1
+        self._metrics["last_sweep_at"] = time.time()
+        self._metrics["last_sweep_seconds"] = time.monotonic() - started_at
+        reclaimed = self._metrics["bytes_reclaimed"] - reclaimed_before
+        if reclaimed:
+            print(f"磁盘清理完成，释放 {reclaimed} 字节")
+
+    async def _run(self) -> None:
+        while True:
+            await self.sweep()
+            await asyncio.sleep(self.interval_seconds)
+
+    def start(self) -> None:
+        """启动后台清理任务"""
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        """停止后台清理任务"""
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> Dict[str, Any]:
+        """返回累计清理指标"""
+        return dict(self._metrics)
+
+file_janitor = FileJanitor()
@@ -0,0 +1,232 @@
+import asyncio
+import os
+import time
+from collections import OrderedDict, deque
+from typing import Any, AsyncGenerator, Deque, Dict, Optional
+
+
+class LLMQueueFullError(Exception):
+    """模型调用排队已满"""
+
+
+class _TokenBucket:
+    """令牌桶，按固定速率补充，容量为每分钟配额"""
+
+    def __init__(self, per_minute: float):
+        self.capacity = per_minute
+        self.rate = per_minute / 60.0
+        self.tokens = per_minute
+        self.updated_at = time.monotonic()
+
+    def _refill(self) -> None:
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+
+    def wait_time(self, amount: float) -> float:
+        """距离可以取出amount个令牌还需等待的秒数"""
+        self._refill()
+        amount = min(amount, self.capacity)
+        return 0.0 if self.tokens >= amount else (amount - self.tokens) / self.rate
+
+    def consume(self, amount: float) -> None:
+        self._refill()
+        self.tokens -= min(amount, self.capacity)
+
+    def adjust(self, amount: float) -> None:
+        """按实际用量修正预估消耗，amount为正表示多用，为负表示退回"""
+        self._refill()
+        self.tokens = min(self.capacity, self.tokens - amount)
+
+
+class LLMTicket:
+    """一次模型调用的排队凭证"""
+
+    def __init__(self, client_id: str, estimated_tokens: int):
+        self.client_id = client_id
+        self.estimated_tokens = estimated_tokens
+        self.enqueued_at = time.monotonic()
+        self.admitted_at: Optional[float] = None
+        self.released = False
+        self._admitted = asyncio.Event()
+
+
+class LLMScheduler:
+    """模型调用准入控制
+
+    限制同时进行的模型调用数，排队的请求按客户端轮转调度，避免单个客户端的突发请求占满名额；
+    放行前按每分钟请求数（RPM）和每分钟Token数（TPM）令牌桶限速，
+    上游过载时表现为可预期的排队，而不是429错误。
+    """
+
+    def __init__(
+        self,
+        max_concurrency: int = None,
+        max_queue: int = None,
+        rpm: int = None,
+        tpm: int = None,
+        position_interval: float = None
+    ):
+        self.max_concurrency = max_concurrency or int(os.getenv("LLM_MAX_CONCURRENCY", "4"))
+        self.max_queue = max_queue or int(os.getenv("LLM_MAX_QUEUE", "100"))
+        self.position_interval = position_interval or float(os.getenv("LLM_QUEUE_POSITION_INTERVAL", "2"))
+        self._requests = _TokenBucket(rpm or int(os.getenv("LLM_RPM", "60")))
+        self._tokens = _TokenBucket(tpm or int(os.getenv("LLM_TPM", "100000")))
+        # 每个客户端一个先进先出队列，客户端之间按轮转顺序放行
+        self._queues: "OrderedDict[str, Deque[LLMTicket]]" = OrderedDict()
+        self._waiting = 0
+        self._active = 0
+        self._timer: Optional[asyncio.TimerHandle] = None
+        self._metrics = {
+            "admitted": 0,
+            "rejected": 0,
+            "cancelled": 0,
+            "queue_wait_total": 0.0,
+            "queue_wait_max": 0.0,
+        }
+
+    def is_saturated(self) -> bool:
+        """排队请求是否已达上限"""
+        return self._waiting >= self.max_queue
+
+    def enqueue(self, client_id: str, estimated_tokens: int) -> LLMTicket:
+        """
+        为一次模型调用排队
+
+        参数:
+            client_id: 客户端标识，同一客户端的请求按顺序放行
+            estimated_tokens: 预估的输入与输出Token总数
+
+        返回:
+            排队凭证，需配合 wait 和 release 使用
+
+        异常:
+            LLMQueueFullError: 排队请求已达上限
+        """
+        if self.is_saturated():
+            self._metrics["rejected"] += 1
+            raise LLMQueueFullError(f"模型调用繁忙，当前排队 {self._waiting} 个请求，请稍后重试")
+
+        ticket = LLMTicket(client_id or "anonymous", estimated_tokens)
+        self._queues.setdefault(ticket.client_id, deque()).append(ticket)
+        self._waiting += 1
+        self._dispatch()
+        return ticket
+
+    async def enqueue_when_available(self, client_id: str, estimated_tokens: int) -> LLMTicket:
+        """
+        排队已满时等待出现空位后再排队，用于已被接受的请求内部的后续调用（如分章节生成的各章节）
+
+        参数:
+            client_id: 客户端标识
+            estimated_tokens: 预估的输入与输出Token总数
+
+        返回:
+            排队凭证
+        """
+        while self.is_saturated():
+            await asyncio.sleep(self.position_interval)
+        return self.enqueue(client_id, estimated_tokens)
+
+    def position(self, ticket: LLMTicket) -> int:
+        """按轮转放行顺序计算凭证前面还有多少个请求，已放行时返回0"""
+        if ticket.admitted_at is not None:
+            return 0
+        queues = [list(queue) for queue in self._queues.values()]
+        ahead = 0
+        for round_index in range(max((len(queue) for queue in queues), default=0)):
+            for queue in queues:
+                if round_index < len(queue):
+                    if queue[round_index] is ticket:
+                        return ahead
+                    ahead += 1
+        return ahead
+
+    async def wait(self, ticket: LLMTicket) -> AsyncGenerator[int, None]:
+        """
+        等待放行，等待期间定期产出当前排队位置
+
+        参数:
+            ticket: enqueue 返回的排队凭证
+
+        返回:
+            排队位置的异步迭代器，放行后结束
+        """
+        while ticket.admitted_at is None:
+            yield self.position(ticket)
+            try:
+                await asyncio.wait_for(ticket._admitted.wait(), timeout=self.position_interval)
+            except asyncio.TimeoutError:
+                pass
+
+    def release(self, ticket: LLMTicket, actual_tokens: Optional[int] = None) -> None:
+        """
+        结束一次模型调用，未放行的凭证从队列中移除
+
+        参数:
+            ticket: 排队凭证
+            actual_tokens: 实际消耗的Token数，用于修正令牌桶
+        """
+        if ticket.released:
+            return
+        ticket.released = True
+
+        if ticket.admitted_at is None:
+            queue = self._queues.get(ticket.client_id)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self._queues[ticket.client_id]
+                self._waiting -= 1
+                self._metrics["cancelled"] += 1
+        else:
+            self._active -= 1
+            if actual_tokens is not None:
+                self._tokens.adjust(actual_tokens - ticket.estimated_tokens)
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """在并发名额和限速允许时按轮转顺序放行排队的请求"""
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+        while self._active < self.max_concurrency and self._queues:
+            client_id, queue = next(iter(self._queues.items()))
+            ticket = queue[0]
+
+            delay = max(self._requests.wait_time(1), self._tokens.wait_time(ticket.estimated_tokens))
+            if delay > 0:
+                # 限速时在令牌补足后再次尝试
+                self._timer = asyncio.get_running_loop().call_later(delay, self._dispatch)
+                return
+
+            self._requests.consume(1)
+            self._tokens.consume(ticket.estimated_tokens)
+            queue.popleft()
+            # 放行一个请求后该客户端移到轮转末尾
+            del self._queues[client_id]
+            if queue:
+                self._queues[client_id] = queue
+            self._waiting -= 1
+            self._active += 1
+
+            ticket.admitted_at = time.monotonic()
+            ticket._admitted.set()
+            queue_wait = ticket.admitted_at - ticket.enqueued_at
+            self._metrics["admitted"] += 1
+            self._metrics["queue_wait_total"] += queue_wait
+            self._metrics["queue_wait_max"] = max(self._metrics["queue_wait_max"], queue_wait)
+
+    def stats(self) -> Dict[str, Any]:
+        """返回当前并发、排队情况和累计指标"""
+        admitted = self._metrics["admitted"]
+        return {
+            **self._metrics,
+            "active": self._active,
+            "waiting": self._waiting,
+            "clients_waiting": len(self._queues),
+            "max_concurrency": self.max_concurrency,
+            "max_queue": self.max_queue,
+            "queue_wait_avg": self._metrics["queue_wait_total"] / admitted if admitted else 0.0,
+        }
@@ -0,0 +1,186 @@
+import os
+import re
+from typing import List, Optional, Tuple, Union
+
+"""这个模块负责把长PRD按标题拆分为若干章节，每个章节携带其中引用的图片，
+供分章节并发生成测试用例使用。"""
+
+_HEADING_PATTERN = re.compile(r"^(#{1,6})\s+(.+?)\s*#*\s*$")
+_IMAGE_MARKER_PATTERN = re.compile(r"\[图片(\d+)\]")
+# 对生成测试用例帮助不大的章节，可带编号，如“1. 修订记录”“附录”
+_LOW_VALUE_TITLE_PATTERN = re.compile(
+    r"^\s*(?:\d+(?:\.\d+)*\.?|[一二三四五六七八九十]+、)?\s*(?:%s)\s*$"
+    % os.getenv("PRD_LOW_VALUE_SECTIONS", "修订记录|修改记录|变更记录|版本记录|版本历史|文档历史|目录|参考资料|参考文档|术语|名词解释|附录")
+)
+
+
+class PRDSection:
+    """PRD中的一个章节"""
+
+    def __init__(self, title: str, text: str, images: List[Union[bytes, str]]):
+        self.title = title
+        self.text = text
+        self.images = images
+
+    def __repr__(self) -> str:
+        return f"PRDSection(title={self.title!r}, chars={len(self.text)}, images={len(self.images)})"
+
+
+def _split_by_headings(prd_text: str) -> List[Tuple[str, List[str]]]:
+    """按标题切分为 (标题路径, 行列表)，标题路径由各级标题用 > 连接"""
+    sections: List[Tuple[str, List[str]]] = []
+    heading_stack: List[Tuple[int, str]] = []
+    title, lines = "", []
+    in_code_block = False
+
+    for line in prd_text.splitlines():
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+        match = None if in_code_block else _HEADING_PATTERN.match(line)
+        if match:
+            if any(l.strip() for l in lines):
+                sections.append((title, lines))
+            level = len(match.group(1))
+            heading_stack = [item for item in heading_stack if item[0] < level] + [(level, match.group(2))]
+            title = " > ".join(text for _, text in heading_stack)
+            lines = [line]
+        else:
+            lines.append(line)
+
+    if any(l.strip() for l in lines):
+        sections.append((title, lines))
+    return sections
+
+
+def _split_oversized(title: str, lines: List[str], max_chars: int) -> List[Tuple[str, str]]:
+    """超长章节按空行分隔的段落继续拆分，单个段落不再拆开"""
+    text = "\n".join(lines)
+    if len(text) <= max_chars:
+        return [(title, text)]
+
+    parts, current = [], ""
+    for paragraph in re.split(r"\n\s*\n", text):
+        if current and len(current) + len(paragraph) + 2 > max_chars:
+            parts.append(current)
+            current = paragraph
+        else:
+            current = f"{current}\n\n{paragraph}" if current else paragraph
+    if current:
+        parts.append(current)
+    return [(f"{title}（{i + 1}/{len(parts)}）" if title else "", part) for i, part in enumerate(parts)]
+
+
+def document_outline(prd_text: str, max_level: int = 3) -> List[str]:
+    """提取文档的标题目录，用于让各章节的生成了解全文结构"""
+    outline = []
+    in_code_block = False
+    for line in prd_text.splitlines():
+        if line.strip().startswith("```"):
+            in_code_block = not in_code_block
+            continue
+        match = None if in_code_block else _HEADING_PATTERN.match(line)
+        if match and len(match.group(1)) <= max_level:
+            outline.append(f"{'  ' * (len(match.group(1)) - 1)}- {match.group(2)}")
+    return outline
+
+
+def drop_low_value_sections(
+    prd_text: str,
+    prd_images: List[Union[bytes, str]]
+) -> Tuple[str, List[Union[bytes, str]], List[str]]:
+    """
+    删除修订记录、目录、附录等低价值章节（含其子章节）
+
+    只在这些章节中引用的图片随之删除，其余图片的[图片N]标记重新编号；没有位置标记的图片保留。
+
+    返回:
+        (删除后的文本, 图片列表, 被删除的章节标题)
+    """
+    kept_lines: List[str] = []
+    dropped: List[str] = []
+    for title, lines in _split_by_headings(prd_text):
+        headings = title.split(" > ") if title else []
+        if any(_LOW_VALUE_TITLE_PATTERN.match(heading) for heading in headings):
+            dropped.append(headings[-1])
+        else:
+            kept_lines.extend(lines)
+    if not dropped:
+        return prd_text, prd_images, []
+
+    text = "\n".join(kept_lines)
+    referenced_before = {int(n) - 1 for n in _IMAGE_MARKER_PATTERN.findall(prd_text)}
+    referenced_after = {int(n) - 1 for n in _IMAGE_MARKER_PATTERN.findall(text)}
+    images: List[Union[bytes, str]] = []
+    new_numbers = {}
+    for index, image in enumerate(prd_images):
+        if index in referenced_after or index not in referenced_before:
+            images.append(image)
+            new_numbers[index] = len(images)
+
+    def renumber(match: re.Match) -> str:
+        index = int(match.group(1)) - 1
+        return f"[图片{new_numbers[index]}]" if index in new_numbers else match.group(0)
+
+    return _IMAGE_MARKER_PATTERN.sub(renumber, text), images, dropped
+
+
+def split_prd_sections(
+    prd_text: str,
+    prd_images: List[Union[bytes, str]],
+    max_chars: Optional[int] = None
+) -> List[PRDSection]:
+    """
+    将PRD拆分为大小适中的章节
+
+    相邻的短章节会合并到不超过max_chars；文本中以[图片N]标记的图片随所在章节分配，
+    并在章节内重新编号；没有位置标记的图片（如直接上传的图片）归入第一个章节。
+
+    参数:
+        prd_text: PRD文本
+        prd_images: 与[图片N]标记对应的图片列表
+        max_chars: 单个章节的最大字符数
+
+    返回:
+        章节列表
+    """
+    max_chars = max_chars or int(os.getenv("PRD_SECTION_MAX_CHARS", "6000"))
+
+    pieces: List[Tuple[str, str]] = []
+    for title, lines in _split_by_headings(prd_text):
+        pieces.extend(_split_oversized(title, lines, max_chars))
+
+    # 合并相邻的短章节
+    merged: List[Tuple[str, str]] = []
+    for title, text in pieces:
+        if merged and len(merged[-1][1]) + len(text) + 2 <= max_chars:
+            merged_title = "；".join(t for t in (merged[-1][0], title) if t)
+            merged[-1] = (merged_title, f"{merged[-1][1]}\n\n{text}")
+        else:
+            merged.append((title, text))
+
+    sections: List[PRDSection] = []
+    referenced = set()
+    for title, text in merged:
+        images: List[Union[bytes, str]] = []
+        local_numbers = {}
+
+        def renumber(match: re.Match) -> str:
+            index = int(match.group(1)) - 1
+            if not 0 <= index < len(prd_images):
+                return match.group(0)
+            if index not in local_numbers:
+                images.append(prd_images[index])
+                local_numbers[index] = len(images)
+                referenced.add(index)
+            return f"[图片{local_numbers[index]}]"
+
+        text = _IMAGE_MARKER_PATTERN.sub(renumber, text)
+        sections.append(PRDSection(title or "概述", text, images))
+
+    unreferenced = [image for i, image in enumerate(prd_images) if i not in referenced]
+    if unreferenced:
+        if not sections:
+            sections.append(PRDSection("概述", prd_text, []))
+        sections[0].images.extend(unreferenced)
+
+    return sections
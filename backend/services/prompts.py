@@ -1,10 +1,13 @@
+from typing import List
+
+
 class TestCasePrompts:
     """测试用例生成相关的提示词模板"""
   
     @staticmethod
-    def get_multimodal_prd_prompt(prd_text: str, context: str, requirements: str) -> str:
-        """获取多模态PRD分析的提示词"""
-        format_instructions = TestCasePrompts._get_format_instructions()
+    def get_multimodal_prd_prompt(prd_text: str, context: str, requirements: str, output_format: str = "markdown") -> str:
+        """获取多模态PRD分析的提示词，output_format 为 json 时要求结构化输出"""
+        format_instructions = TestCasePrompts._get_format_instructions(output_format)
         return f"""请基于PRD文档内容（包括文本和图片）生成全面的测试用例。
 
 PRD文档文本内容:
@@ -20,12 +23,61 @@ PRD文档文本内容:
 1. 分析图片中的UI元素、交互流程和业务逻辑
 2. 结合文本描述理解完整的产品需求
 3. 确保测试用例涵盖正常流程、异常流程和边界条件
-4. 考虑不同用户角色和使用场景"""
+4. 考虑不同用户角色和使用场景
+5. 文本中如出现[图片N]标记，表示第N张图片在文档中的位置，请结合其所在章节理解图片内容"""
     
     @staticmethod
-    def _get_format_instructions() -> str:
+    def get_section_prompt(
+        section_text: str,
+        section_title: str,
+        section_index: int,
+        section_count: int,
+        outline: str,
+        context: str,
+        requirements: str,
+        output_format: str = "markdown"
+    ) -> str:
+        """获取分章节生成时单个章节的提示词"""
+        format_instructions = TestCasePrompts._get_format_instructions(output_format)
+        return f"""这是一份较长的PRD文档，已按章节拆分处理。请只针对下面第{section_index}/{section_count}部分「{section_title}」的内容（包括文本和随附的图片）生成测试用例。
+
+文档目录（帮助理解本部分在全文中的位置）:
+{outline or "（无）"}
+
+本部分内容:
+{section_text}
+
+上下文信息: {context}
+
+特殊要求: {requirements}
+
+{format_instructions}
+
+请注意：
+1. 只覆盖本部分描述的功能点、用户场景和边界条件，其他章节会单独生成
+2. 登录等通用前置流程写入前置条件，不要单独生成测试用例
+3. 确保测试用例涵盖正常流程、异常流程和边界条件
+4. 文本中如出现[图片N]标记，表示随附的第N张图片在文档中的位置，请结合其所在段落理解图片内容"""
+
+    @staticmethod
+    def get_continuation_prompt(prompt: str, completed_cases: List[str], last_id: str) -> str:
+        """获取生成中断后续写的提示词，列出已完成的用例避免重复生成"""
+        if not completed_cases:
+            return prompt
+        completed = "\n".join(f"- {case}" for case in completed_cases)
+        return f"""{prompt}
+
+注意：上一次生成在 {last_id} 之后中断，以下测试用例已经生成完毕：
+{completed}
+
+请从 {last_id} 之后继续，直接输出剩余的测试用例，编号接续已有用例，不要重复已生成的用例，也不要输出任何说明文字。"""
+
+    @staticmethod
+    def _get_format_instructions(output_format: str = "markdown") -> str:
         """获取测试用例格式说明"""
-        return """请先以 Markdown 格式生成测试用例，包含以下内容：
+        if output_format == "json":
+            return TestCasePrompts._get_json_format_instructions()
+        return """请以 Markdown 格式生成测试用例，包含以下内容：
 1. 测试用例 ID 和标题（使用二级标题格式，如 ## TC-001: 测试标题）
 2. 优先级（加粗显示，如 **优先级:** 高）
 3. 描述（加粗显示，如 **描述:** 测试描述）
@@ -45,7 +97,16 @@ PRD文档文本内容:
 
 请确保表格格式正确，包含表头和分隔行。
 
-然后，在生成完 Markdown 格式的测试用例后，请生成结构化的测试用例数据，包含相同的内容，但使用 JSON 格式，以便于导出到 Excel。
+请确保测试用例覆盖全面，包含正向和负向测试场景。"""
+
+    @staticmethod
+    def _get_json_format_instructions() -> str:
+        """获取结构化输出的格式说明"""
+        return """请以 JSON 格式输出测试用例，不要输出 JSON 以外的任何内容。格式如下：
+
+```
+{"test_cases": [{"id": "TC-001", "title": "测试标题", "description": "测试描述", "preconditions": "前置条件，没有时为null", "priority": "高", "steps": [{"step_number": 1, "description": "第一步描述", "expected_result": "第一步预期结果"}]}]}
+```
 
 请确保测试用例覆盖全面，包含正向和负向测试场景。"""
 
@@ -72,6 +133,11 @@ class ErrorMessages:
         """获取飞书相关错误消息"""
         return f"获取飞书文档内容失败: {error_detail}"
     
+    @staticmethod
+    def get_token_budget_error(estimated_tokens: int, budget: int) -> str:
+        """获取超出Token预算的错误消息"""
+        return f"PRD预估需要约 {estimated_tokens} 个输入Token，超出单次请求预算 {budget}，请精简文档或使用分章节生成"
+
     @staticmethod
     def get_generation_error(error_detail: str) -> str:
         """获取测试用例生成错误消息"""
@@ -0,0 +1,155 @@
+import json
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Any, Dict, Optional, Set
+
+
+class ResultStore:
+    """导出结果索引
+
+    记录results目录中每个导出文件的元数据（所属客户端、大小、创建时间、来源生成ID），
+    下载接口只按索引查找文件；索引以JSON文件持久化，并按总大小和保留时间淘汰旧文件。
+    """
+
+    MEDIA_TYPES = {
+        ".xlsx": "application/vnd.openxmlformats-officedocument.spreadsheetml.sheet",
+    }
+
+    def __init__(self, directory: str = None, max_total_mb: int = None, max_age_hours: float = None):
+        self.directory = directory or os.getenv("RESULTS_DIR", "results")
+        self.max_total_bytes = (max_total_mb or int(os.getenv("RESULTS_MAX_TOTAL_MB", "1024"))) * 1024 * 1024
+        self.max_age_seconds = (max_age_hours or float(os.getenv("RESULTS_MAX_AGE_HOURS", "24"))) * 3600
+        self.index_path = os.path.join(self.directory, "index.json")
+        os.makedirs(self.directory, exist_ok=True)
+        self._entries: "OrderedDict[str, Dict[str, Any]]" = OrderedDict()
+        self._total_bytes = 0
+        self._load()
+
+    def _load(self) -> None:
+        """读取索引，丢弃文件已不存在的条目"""
+        try:
+            with open(self.index_path, "r", encoding="utf-8") as f:
+                entries = json.load(f)
+        except (FileNotFoundError, ValueError):
+            entries = []
+
+        for entry in sorted(entries, key=lambda item: item["created_at"]):
+            if os.path.isfile(os.path.join(self.directory, entry["filename"])):
+                self._entries[entry["filename"]] = entry
+                self._total_bytes += entry["size"]
+        self._save()
+
+    def _save(self) -> None:
+        """原子地写入索引"""
+        tmp_path = self.index_path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(list(self._entries.values()), f, ensure_ascii=False)
+        os.replace(tmp_path, self.index_path)
+
+    def register(self, path: str, owner: str = None, generation_id: str = None, case_count: int = None) -> Dict[str, Any]:
+        """
+        登记新生成的导出文件，并按配额淘汰旧文件
+
+        参数:
+            path: 导出文件路径，须位于results目录
+            owner: 发起导出的客户端标识
+            generation_id: 来源生成ID（如有）
+            case_count: 导出的用例数
+
+        返回:
+            文件的元数据
+        """
+        filename = os.path.basename(path)
+        entry = {
+            "filename": filename,
+            "size": os.path.getsize(path),
+            "created_at": time.time(),
+            "owner": owner,
+            "generation_id": generation_id,
+            "case_count": case_count,
+        }
+        self._entries[filename] = entry
+        self._total_bytes += entry["size"]
+        self._evict(keep=filename)
+        self._save()
+        return entry
+
+    def get(self, filename: str) -> Optional[Dict[str, Any]]:
+        """
+        按文件名查找导出文件
+
+        参数:
+            filename: 文件名
+
+        返回:
+            包含文件路径的元数据，未登记、已过期或文件已被删除时返回None
+        """
+        entry = self._entries.get(filename)
+        if entry is None:
+            return None
+
+        path = os.path.join(self.directory, filename)
+        if time.time() - entry["created_at"] > self.max_age_seconds or not os.path.isfile(path):
+            self._remove(filename)
+            self._save()
+            return None
+
+        ext = os.path.splitext(filename)[1]
+        return {**entry, "path": path, "media_type": self.MEDIA_TYPES.get(ext, "application/octet-stream")}
+
+    def reserved_names(self) -> Set[str]:
+        """目录清理时需跳过的文件：索引文件及已登记的导出文件"""
+        index_name = os.path.basename(self.index_path)
+        return {index_name, index_name + ".tmp", *self._entries}
+
+    def prune(self) -> int:
+        """
+        淘汰过期和超出配额的文件，并移除文件已被外部删除的条目
+
+        返回:
+            释放的字节数
+        """
+        for filename in [name for name in self._entries if not os.path.isfile(os.path.join(self.directory, name))]:
+            self._remove(filename)
+        reclaimed = self._evict()
+        self._save()
+        return reclaimed
+
+    def _remove(self, filename: str) -> int:
+        """删除条目及对应的文件，返回释放的字节数"""
+        entry = self._entries.pop(filename)
+        self._total_bytes -= entry["size"]
+        try:
+            os.remove(os.path.join(self.directory, filename))
+        except FileNotFoundError:
+            return 0
+        return entry["size"]
+
+    def _evict(self, keep: str = None) -> int:
+        """淘汰过期文件，总大小仍超限时按创建时间从旧到新淘汰"""
+        reclaimed = 0
+        expire_before = time.time() - self.max_age_seconds
+        for filename, entry in list(self._entries.items()):
+            if filename == keep:
+                continue
+            if entry["created_at"] < expire_before or self._total_bytes > self.max_total_bytes:
+                reclaimed += self._remove(filename)
+            else:
+                break
+        if reclaimed:
+            print(f"导出结果淘汰 {reclaimed} 字节，当前占用 {self._total_bytes} 字节")
+        return reclaimed
+
+    def stats(self) -> Dict[str, Any]:
+        """返回索引中的文件数和占用空间"""
+        oldest = next(iter(self._entries.values()), None)
+        return {
+            "files": len(self._entries),
+            "total_bytes": self._total_bytes,
+            "max_total_bytes": self.max_total_bytes,
+            "oldest_created_at": datetime.fromtimestamp(oldest["created_at"]).isoformat() if oldest else None,
+        }
+
+result_store = ResultStore()
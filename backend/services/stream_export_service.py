@@ -0,0 +1,128 @@
+import csv
+import io
+import json
+import zipfile
+from typing import Any, Dict, Iterable, Iterator, List, Union
+
+from models.test_case import TestCase
+from .excel_service import excel_service
+
+
+class _ZipStream(io.RawIOBase):
+    """不可回退的写入缓冲区，zipfile写入的数据随时取出发送给客户端"""
+
+    def __init__(self):
+        self._chunks: List[bytes] = []
+
+    def writable(self) -> bool:
+        return True
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def drain(self) -> bytes:
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+class StreamExportService:
+    """流式导出服务
+
+    CSV和JSONL逐批生成字节块，直接写入 StreamingResponse，不落盘；
+    多种格式可打包为边生成边发送的ZIP。
+    """
+
+    MEDIA_TYPES = {
+        "csv": "text/csv; charset=utf-8",
+        "jsonl": "application/x-ndjson",
+        "zip": "application/zip",
+    }
+
+    def iter_csv(self, test_cases: Iterable[Union[TestCase, Dict[str, Any]]], batch_rows: int = 500) -> Iterator[bytes]:
+        """
+        按Excel导出相同的列生成CSV
+
+        参数:
+            test_cases: 测试用例的可迭代对象
+            batch_rows: 每个字节块包含的行数
+
+        返回:
+            UTF-8编码的字节块迭代器，开头带BOM以便Excel正确识别中文
+        """
+        buffer = io.StringIO()
+        writer = csv.writer(buffer)
+        buffer.write("\ufeff")
+        writer.writerow(excel_service.COLUMNS)
+
+        for i, row in enumerate(excel_service.iter_rows(test_cases), start=1):
+            writer.writerow(["" if value is None else value for value in row])
+            if i % batch_rows == 0:
+                yield buffer.getvalue().encode("utf-8")
+                buffer.seek(0)
+                buffer.truncate()
+
+        if buffer.tell():
+            yield buffer.getvalue().encode("utf-8")
+
+    def iter_jsonl(self, test_cases: Iterable[Union[TestCase, Dict[str, Any]]], batch_cases: int = 200) -> Iterator[bytes]:
+        """
+        每行一个测试用例的JSON Lines
+
+        参数:
+            test_cases: 测试用例的可迭代对象
+            batch_cases: 每个字节块包含的用例数
+
+        返回:
+            UTF-8编码的字节块迭代器
+        """
+        lines = []
+        for tc in test_cases:
+            data = tc if isinstance(tc, dict) else tc.model_dump(mode="json")
+            lines.append(json.dumps(data, ensure_ascii=False))
+            if len(lines) >= batch_cases:
+                yield ("\n".join(lines) + "\n").encode("utf-8")
+                lines = []
+
+        if lines:
+            yield ("\n".join(lines) + "\n").encode("utf-8")
+
+    def iter_zip(
+        self,
+        test_cases: List[Union[TestCase, Dict[str, Any]]],
+        formats: List[str],
+        filename_prefix: str = "test_cases",
+        excel_path: str = None
+    ) -> Iterator[bytes]:
+        """
+        将多种格式打包为ZIP，边压缩边输出
+
+        参数:
+            test_cases: 测试用例列表
+            formats: 要打包的格式，支持 csv、jsonl、xlsx
+            filename_prefix: 包内文件名前缀
+            excel_path: 已生成的Excel文件路径，formats包含xlsx时必须提供
+
+        返回:
+            ZIP字节块迭代器
+        """
+        stream = _ZipStream()
+        with zipfile.ZipFile(stream, "w", compression=zipfile.ZIP_DEFLATED) as archive:
+            for export_format in formats:
+                name = f"{filename_prefix}.{export_format}"
+                with archive.open(name, "w", force_zip64=True) as entry:
+                    if export_format == "xlsx":
+                        with open(excel_path, "rb") as f:
+                            for block in iter(lambda: f.read(1024 * 1024), b""):
+                                entry.write(block)
+                                yield stream.drain()
+                    else:
+                        chunks = self.iter_csv(test_cases) if export_format == "csv" else self.iter_jsonl(test_cases)
+                        for chunk in chunks:
+                            entry.write(chunk)
+                            yield stream.drain()
+                yield stream.drain()
+        yield stream.drain()
+
+stream_export_service = StreamExportService()
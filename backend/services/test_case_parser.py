@@ -0,0 +1,322 @@
+import json
+import re
+from typing import List, Dict, Any, Optional
+
+# 表格单元格之间的分隔符，单元格内容中的 \| 不作分隔
+_CELL_SEPARATOR = re.compile(r'(?<!\\)\|')
+
+
+class StreamingTestCaseParser:
+    """增量式测试用例解析器
+
+    按块接收模型输出的Markdown文本，逐行驱动状态机，
+    每当一个 ## TC-xxx 用例的步骤表格结束时立即产出该用例，
+    无需等待整个生成过程完成。
+    """
+
+    TABLE_SEPARATOR = '| --- | --- | --- |'
+
+    def __init__(self):
+        self.test_cases: List[Dict[str, Any]] = []
+        self._pending = ""
+        self._current_test_case: Optional[Dict[str, Any]] = None
+        self._current_steps: List[Dict[str, Any]] = []
+        self._in_table = False
+        self._description_index = 1
+        self._expected_index = 2
+        self._last_table_line: Optional[str] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        输入一段流式文本
+
+        参数:
+            chunk: 模型输出的文本片段
+
+        返回:
+            本次输入后新完成的测试用例列表
+        """
+        if '\n' not in chunk:
+            self._pending += chunk
+            return []
+
+        lines = (self._pending + chunk).split('\n')
+        # 最后一段可能是不完整的行，留待下一次输入
+        self._pending = lines.pop()
+
+        completed = []
+        for line in lines:
+            test_case = self._process_line(line)
+            if test_case is not None:
+                completed.append(test_case)
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        结束输入，处理剩余文本并产出最后一个测试用例
+
+        返回:
+            剩余完成的测试用例列表
+        """
+        completed = []
+        if self._pending:
+            test_case = self._process_line(self._pending)
+            self._pending = ""
+            if test_case is not None:
+                completed.append(test_case)
+
+        test_case = self._finish_current()
+        if test_case is not None:
+            completed.append(test_case)
+        return completed
+
+    def checkpoint(self) -> List[Dict[str, Any]]:
+        """
+        在用例边界处结束当前用例，不必等待下一个用例标题
+
+        返回:
+            因此完成的测试用例列表
+        """
+        test_case = self._finish_current()
+        return [test_case] if test_case is not None else []
+
+    def discard(self, keep_cases: int) -> None:
+        """
+        丢弃未完成的用例和未处理的文本，只保留前keep_cases个已完成的用例，用于生成中断后续写
+
+        参数:
+            keep_cases: 最后一个检查点时已完成的用例数
+        """
+        del self.test_cases[keep_cases:]
+        self._pending = ""
+        self._current_test_case = None
+        self._current_steps = []
+        self._in_table = False
+
+    def _process_line(self, line: str) -> Optional[Dict[str, Any]]:
+        """处理一行完整文本，若某个测试用例因此完成则返回它"""
+        completed = None
+
+        # 检测新测试用例的开始
+        if line.startswith('## '):
+            completed = self._finish_current()
+
+            title_parts = line[3:].strip().split(': ', 1)
+            if len(title_parts) > 1:
+                test_id = title_parts[0].strip()
+                title = title_parts[1].strip()
+            else:
+                test_id = f"TC-{len(self.test_cases) + 1}"
+                title = line[3:].strip()
+
+            self._current_test_case = {
+                'id': test_id,
+                'title': title,
+                'description': '',
+                'preconditions': None,
+                'priority': None
+            }
+            self._current_steps = []
+            self._in_table = False
+
+        elif self._current_test_case is None:
+            pass
+
+        # 提取优先级
+        elif line.startswith('**优先级:**'):
+            self._current_test_case['priority'] = line.replace('**优先级:**', '').strip()
+
+        # 提取描述
+        elif line.startswith('**描述:**'):
+            self._current_test_case['description'] = line.replace('**描述:**', '').strip()
+
+        # 提取前置条件
+        elif line.startswith('**前置条件:**'):
+            self._current_test_case['preconditions'] = line.replace('**前置条件:**', '').strip()
+
+        # 检测表格头，表头即上一条表格行
+        elif self.TABLE_SEPARATOR in line:
+            self._in_table = True
+            if self._last_table_line is not None:
+                self._locate_step_columns([h.strip() for h in self._last_table_line.split('|')[1:-1]])
+
+        # 提取测试步骤
+        elif self._in_table and line.count('|') > 2 and '---' not in line:
+            self._parse_step_row(line)
+
+        # 步骤表格之后出现非表格行，说明当前用例已完整
+        elif self._in_table and self._current_steps and '|' not in line:
+            completed = self._finish_current()
+
+        if '|' in line:
+            self._last_table_line = line
+
+        return completed
+
+    def _parse_step_row(self, line: str) -> None:
+        """解析步骤表格中的一行"""
+        cells = [cell.strip().replace('\\|', '|') for cell in _CELL_SEPARATOR.split(line)[1:-1]]
+        if len(cells) < 3:
+            return
+
+        try:
+            step_number = int(cells[0])
+        except ValueError:
+            return  # 忽略无法解析的行
+
+        description_index, expected_index = self._description_index, self._expected_index
+        self._current_steps.append({
+            'step_number': step_number,
+            'description': cells[description_index] if description_index < len(cells) else '',
+            'expected_result': cells[expected_index] if expected_index < len(cells) else ''
+        })
+
+    def _locate_step_columns(self, headers: List[str]) -> None:
+        """根据表头确定步骤描述和预期结果所在的列，默认为第2、3列"""
+        self._description_index, self._expected_index = 1, 2
+        for i, header in enumerate(headers):
+            lowered = header.lower()
+            if '预期' in header or 'expected' in lowered:
+                self._expected_index = i
+            elif '描述' in header or 'description' in lowered:
+                self._description_index = i
+
+    def _finish_current(self) -> Optional[Dict[str, Any]]:
+        """结束当前测试用例，只有包含步骤的用例才会被产出"""
+        test_case = None
+        if self._current_test_case is not None and self._current_steps:
+            test_case = self._current_test_case
+            test_case['steps'] = self._current_steps
+            self.test_cases.append(test_case)
+
+        self._current_test_case = None
+        self._current_steps = []
+        self._in_table = False
+        return test_case
+
+
+def parse_test_cases(markdown_text: str) -> List[Dict[str, Any]]:
+    """
+    一次性解析完整的Markdown文本，单遍扫描，耗时与文本长度成线性关系
+
+    参数:
+        markdown_text: Markdown格式的测试用例文本
+
+    返回:
+        测试用例列表
+    """
+    parser = StreamingTestCaseParser()
+    parser.feed(markdown_text + '\n')
+    parser.close()
+    return parser.test_cases
+
+
+class StreamingJSONCaseParser:
+    """增量式JSON测试用例解析器
+
+    按块接收模型的结构化输出（{"test_cases": [...]} 或顶层数组），
+    逐字符跟踪字符串和括号嵌套，数组中的每个用例对象一闭合就立即产出，
+    无需等待整个JSON完成。
+    """
+
+    def __init__(self):
+        self.test_cases: List[Dict[str, Any]] = []
+        self._buffer = ""
+        self._scan_pos = 0
+        self._stack: List[str] = []
+        self._in_string = False
+        self._escaped = False
+        self._object_start: Optional[int] = None
+
+    def feed(self, chunk: str) -> List[Dict[str, Any]]:
+        """
+        输入一段流式文本
+
+        参数:
+            chunk: 模型输出的JSON片段
+
+        返回:
+            本次输入后新完成的测试用例列表
+        """
+        self._buffer += chunk
+        completed = []
+        buffer = self._buffer
+        for i in range(self._scan_pos, len(buffer)):
+            char = buffer[i]
+            if self._in_string:
+                if self._escaped:
+                    self._escaped = False
+                elif char == '\\':
+                    self._escaped = True
+                elif char == '"':
+                    self._in_string = False
+            elif char == '"':
+                self._in_string = True
+            elif char in '{[':
+                # 用例对象位于顶层数组或顶层对象的数组字段中
+                if char == '{' and self._stack in (['['], ['{', '[']):
+                    self._object_start = i
+                self._stack.append(char)
+            elif char in '}]' and self._stack:
+                self._stack.pop()
+                if char == '}' and self._object_start is not None and self._stack in (['['], ['{', '[']):
+                    test_case = self._emit(buffer[self._object_start:i + 1])
+                    self._object_start = None
+                    if test_case is not None:
+                        completed.append(test_case)
+
+        # 丢弃已处理完的文本，只保留未闭合的用例对象
+        if self._object_start is not None:
+            self._buffer = buffer[self._object_start:]
+            self._scan_pos = len(buffer) - self._object_start
+            self._object_start = 0
+        else:
+            self._buffer = ""
+            self._scan_pos = 0
+        return completed
+
+    def close(self) -> List[Dict[str, Any]]:
+        """
+        结束输入，未闭合的用例对象被丢弃
+
+        返回:
+            剩余完成的测试用例列表（总为空，接口与Markdown解析器保持一致）
+        """
+        self._buffer = ""
+        self._scan_pos = 0
+        self._object_start = None
+        return []
+
+    def _emit(self, text: str) -> Optional[Dict[str, Any]]:
+        """将一个用例对象转换为与Markdown解析结果相同结构的字典，缺少步骤的用例被忽略"""
+        try:
+            data = json.loads(text)
+        except ValueError:
+            return None
+
+        steps = []
+        for i, step in enumerate(data.get('steps') or []):
+            if not isinstance(step, dict):
+                continue
+            try:
+                step_number = int(step.get('step_number', i + 1))
+            except (TypeError, ValueError):
+                step_number = i + 1
+            steps.append({
+                'step_number': step_number,
+                'description': str(step.get('description') or ''),
+                'expected_result': str(step.get('expected_result') or '')
+            })
+        if not steps:
+            return None
+
+        test_case = {
+            'id': data.get('id') or f"TC-{len(self.test_cases) + 1:03d}",
+            'title': str(data.get('title') or ''),
+            'description': str(data.get('description') or ''),
+            'preconditions': data.get('preconditions') or None,
+            'priority': data.get('priority') or None,
+            'steps': steps
+        }
+        self.test_cases.append(test_case)
+        return test_case
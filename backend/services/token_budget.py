@@ -0,0 +1,232 @@
+import asyncio
+import math
+import os
+import re
+import threading
+from io import BytesIO
+from typing import Callable, List, Optional, Tuple, Union
+
+from PIL import Image as PILImage
+
+from .prd_splitter import PRDSection, drop_low_value_sections, split_prd_sections
+
+_CJK_PATTERN = re.compile(r"[\u3000-\u303f\u3400-\u9fff\uf900-\ufaff\uff00-\uffef]")
+
+
+class TokenEstimator:
+    """请求发送前的Token预估
+
+    文本默认按中文每字一个Token、其余每4个字符一个Token估算，不依赖网络；
+    配置TOKEN_ENCODING后在启动时加载对应的tiktoken分词表计数（需预先放入TIKTOKEN_CACHE_DIR，
+    分词表与通义千问的分词器并不相同，同样只是近似），加载失败或超时时仍按字符估算；
+    图片按通义千问VL的计费方式，缩放后每28×28像素一个Token，并限制在单图上下限之间，另加2个起止Token。
+    """
+
+    def __init__(
+        self,
+        encoding_name: str = None,
+        patch_size: int = None,
+        image_min_tokens: int = None,
+        image_max_tokens: int = None
+    ):
+        self.encoding_name = encoding_name or os.getenv("TOKEN_ENCODING", "")
+        self.load_timeout = float(os.getenv("TOKEN_ENCODING_LOAD_TIMEOUT", "10"))
+        self.patch_size = patch_size or int(os.getenv("LLM_IMAGE_PATCH_SIZE", "28"))
+        self.image_min_tokens = image_min_tokens or int(os.getenv("LLM_IMAGE_MIN_TOKENS", "4"))
+        self.image_max_tokens = image_max_tokens or int(os.getenv("LLM_IMAGE_MAX_TOKENS", "1280"))
+        self._encoding = None
+
+    async def load(self) -> None:
+        """
+        启动时加载配置的分词表，请求路径上不再加载
+
+        缓存目录中没有分词表时tiktoken会下载且没有超时，出站流量被丢弃时会一直等待，
+        因此限定加载时间，超时或失败后按字符估算
+        """
+        if not self.encoding_name or self._encoding is not None:
+            return
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+
+        def load_encoding():
+            try:
+                import tiktoken
+                result = tiktoken.get_encoding(self.encoding_name)
+            except Exception as e:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_exception(e))
+            else:
+                loop.call_soon_threadsafe(lambda: future.done() or future.set_result(result))
+
+        # 使用守护线程，下载卡住时不阻塞服务退出
+        threading.Thread(target=load_encoding, name="tiktoken-load", daemon=True).start()
+        try:
+            self._encoding = await asyncio.wait_for(future, self.load_timeout)
+            print(f"已加载分词表 {self.encoding_name}")
+        except Exception as e:
+            print(f"加载分词表 {self.encoding_name} 失败，按字符数估算Token: {e!r}")
+
+    def count_text(self, text: str) -> int:
+        """预估文本的Token数"""
+        if not text:
+            return 0
+        if self._encoding is not None:
+            return len(self._encoding.encode(text, disallowed_special=()))
+        cjk = len(_CJK_PATTERN.findall(text))
+        return cjk + math.ceil((len(text) - cjk) / 4)
+
+    def count_image(self, source: Union[bytes, str], max_edge: int) -> int:
+        """
+        预估单张图片的Token数
+
+        参数:
+            source: 图片字节或文件路径，只读取文件头获取分辨率
+            max_edge: 预处理时的长边上限
+
+        返回:
+            Token数，图片无法读取时返回0（预处理也会跳过该图片）
+        """
+        try:
+            with PILImage.open(BytesIO(source) if isinstance(source, bytes) else source) as image:
+                width, height = image.size
+        except Exception:
+            return 0
+        if width <= 0 or height <= 0:
+            return 0
+
+        scale = min(1.0, max_edge / max(width, height))
+        patch = self.patch_size
+        patches = max(1, round(width * scale / patch)) * max(1, round(height * scale / patch))
+        return min(max(patches, self.image_min_tokens), self.image_max_tokens) + 2
+
+    def count_images(self, images: List[Union[bytes, str]], max_edge: int) -> int:
+        """预估一组图片的Token总数"""
+        return sum(self.count_image(image, max_edge) for image in images)
+
+
+class BudgetPlan:
+    """Token预算适配结果"""
+
+    def __init__(
+        self,
+        prd_text: str,
+        prd_images: List[Union[bytes, str]],
+        estimated_tokens: int,
+        budget: int,
+        image_max_edge: Optional[int] = None,
+        sections: Optional[List[PRDSection]] = None,
+        adjustments: Optional[List[str]] = None
+    ):
+        self.prd_text = prd_text
+        self.prd_images = prd_images
+        self.estimated_tokens = estimated_tokens
+        self.budget = budget
+        self.image_max_edge = image_max_edge
+        self.sections = sections
+        self.adjustments = adjustments or []
+
+    @property
+    def fits(self) -> bool:
+        """适配后的请求是否在预算内（切换为分章节时由各章节分别控制）"""
+        return bool(self.sections) or self.estimated_tokens <= self.budget
+
+
+class TokenBudget:
+    """单次模型请求的输入Token预算
+
+    超出预算时依次尝试：删除修订记录等低价值章节、缩小图片、切换为分章节生成；
+    仍无法满足时由调用方在发送前直接报错，避免请求在上游排队许久后才失败。
+    """
+
+    def __init__(
+        self,
+        estimator: TokenEstimator = None,
+        max_input_tokens: int = None,
+        default_image_edge: int = None,
+        min_image_edge: int = None
+    ):
+        self.estimator = estimator or TokenEstimator()
+        self.max_input_tokens = max_input_tokens or int(os.getenv("LLM_INPUT_TOKEN_BUDGET", "30000"))
+        self.default_image_edge = default_image_edge or int(os.getenv("IMAGE_MAX_EDGE", "2048"))
+        self.min_image_edge = min_image_edge or int(os.getenv("IMAGE_MIN_EDGE", "512"))
+
+    def _image_edges(self) -> List[int]:
+        """从配置的长边上限起每次缩小四分之一，直到最小长边"""
+        edges = []
+        edge = self.default_image_edge
+        while edge > self.min_image_edge:
+            edge = max(self.min_image_edge, int(edge * 0.75))
+            edges.append(edge)
+        return edges
+
+    def fit_images(self, images: List[Union[bytes, str]], text_tokens: int) -> Tuple[Optional[int], int]:
+        """
+        在文本占用之外为图片选择长边上限
+
+        返回:
+            (长边上限，无需缩小时为None, 图片Token数)，最小长边仍超出预算时返回最小长边
+        """
+        image_tokens = self.estimator.count_images(images, self.default_image_edge)
+        if not images or text_tokens + image_tokens <= self.max_input_tokens:
+            return None, image_tokens
+        edge = None
+        for edge in self._image_edges():
+            image_tokens = self.estimator.count_images(images, edge)
+            if text_tokens + image_tokens <= self.max_input_tokens:
+                break
+        return edge, image_tokens
+
+    def fit(
+        self,
+        prd_text: str,
+        prd_images: List[Union[bytes, str]],
+        build_prompt: Callable[[str], str],
+        allow_sectioned: bool = True
+    ) -> BudgetPlan:
+        """
+        预估整体生成的输入Token数，超出预算时调整请求
+
+        参数:
+            prd_text: PRD文本
+            prd_images: PRD图片
+            build_prompt: 由PRD文本构造完整提示词（含系统消息）的函数
+            allow_sectioned: 是否允许切换为分章节生成
+
+        返回:
+            适配结果，fits 为False时表示无法满足预算
+        """
+        text_tokens = self.estimator.count_text(build_prompt(prd_text))
+        image_tokens = self.estimator.count_images(prd_images, self.default_image_edge)
+        plan = BudgetPlan(prd_text, prd_images, text_tokens + image_tokens, self.max_input_tokens)
+        if plan.fits:
+            return plan
+
+        text, images, dropped = drop_low_value_sections(prd_text, prd_images)
+        if dropped:
+            plan.prd_text, plan.prd_images = text, images
+            plan.adjustments.append(f"省略章节：{'、'.join(dropped)}")
+            text_tokens = self.estimator.count_text(build_prompt(text))
+            image_tokens = self.estimator.count_images(images, self.default_image_edge)
+            plan.estimated_tokens = text_tokens + image_tokens
+            if plan.fits:
+                return plan
+
+        # 文本本身超出预算时缩小图片无济于事
+        if text_tokens <= self.max_input_tokens:
+            edge, image_tokens = self.fit_images(plan.prd_images, text_tokens)
+            if edge is not None:
+                plan.image_max_edge = edge
+                plan.estimated_tokens = text_tokens + image_tokens
+                plan.adjustments.append(f"图片长边缩小至 {edge} 像素")
+                if plan.fits:
+                    return plan
+
+        if allow_sectioned:
+            sections = split_prd_sections(plan.prd_text, plan.prd_images)
+            if len(sections) > 1:
+                # 分章节后各章节图片较少，恢复原始尺寸由各章节分别适配
+                if plan.image_max_edge is not None:
+                    plan.image_max_edge = None
+                    plan.adjustments.pop()
+                plan.sections = sections
+                plan.adjustments.append(f"切换为分章节生成（{len(sections)} 个章节）")
+        return plan
@@ -1,7 +1,30 @@
 import os
-from typing import List
+import time
+from typing import List, Optional, Set, Tuple, Union
 import uuid
 
+import aiofiles
+
+
+class UploadTooLargeError(Exception):
+    """上传内容超过大小限制"""
+
+
+class UploadBudget:
+    """单次请求内所有上传文件共享的字节预算"""
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.used = 0
+
+    def consume(self, size: int) -> None:
+        """
+        记录已写入的字节数，超过预算时抛出 UploadTooLargeError
+        """
+        self.used += size
+        if self.used > self.max_bytes:
+            raise UploadTooLargeError(f"上传总大小超过限制 {self.max_bytes // (1024 * 1024)}MB")
+
 def save_uploaded_file(file_content: bytes, directory: str, filename: str = None) -> str:
     """
     将上传的文件保存到指定目录
@@ -28,44 +51,126 @@ def save_uploaded_file(file_content: bytes, directory: str, filename: str = None
 
     return file_path
 
-def clean_old_files(directory: str, max_age_days: int = 7) -> List[str]:
+async def read_upload(
+    upload,
+    directory: str,
+    filename: str,
+    max_bytes: int,
+    spill_bytes: int,
+    budget: Optional[UploadBudget] = None,
+    chunk_size: int = 1024 * 1024
+) -> Union[bytes, str]:
+    """
+    读取上传文件，不超过阈值时直接返回内存中的字节，超过阈值时才写入磁盘
+
+    参数:
+        upload: 提供异步 read(size) 方法的上传对象（如 UploadFile）
+        directory: 落盘时保存文件的目录
+        filename: 落盘时保存的文件名
+        max_bytes: 单个文件的最大字节数
+        spill_bytes: 内存中保留的最大字节数
+        budget: 同一请求内共享的字节预算（可选）
+        chunk_size: 每次读取的块大小
+
+    返回:
+        文件内容的字节，或落盘后的文件路径
+    """
+    chunks = []
+    size = 0
+    while size <= spill_bytes:
+        chunk = await upload.read(chunk_size)
+        if not chunk:
+            return b"".join(chunks)
+
+        size += len(chunk)
+        if size > max_bytes:
+            raise UploadTooLargeError(f"文件 {filename} 超过单文件大小限制 {max_bytes // (1024 * 1024)}MB")
+        if budget is not None:
+            budget.consume(len(chunk))
+        chunks.append(chunk)
+
+    # 超过内存阈值，已读取的部分先写入，其余部分继续分块写盘
+    os.makedirs(directory, exist_ok=True)
+    file_path = os.path.join(directory, filename)
+    try:
+        async with aiofiles.open(file_path, "wb") as f:
+            for chunk in chunks:
+                await f.write(chunk)
+            chunks.clear()
+            while True:
+                chunk = await upload.read(chunk_size)
+                if not chunk:
+                    break
+
+                size += len(chunk)
+                if size > max_bytes:
+                    raise UploadTooLargeError(f"文件 {filename} 超过单文件大小限制 {max_bytes // (1024 * 1024)}MB")
+                if budget is not None:
+                    budget.consume(len(chunk))
+
+                await f.write(chunk)
+    except BaseException:
+        # 写入失败时删除不完整的文件
+        if os.path.exists(file_path):
+            os.remove(file_path)
+        raise
+
+    return file_path
+
+def clean_old_files(
+    directory: str,
+    max_age_days: float = 7,
+    max_total_bytes: Optional[int] = None,
+    exclude: Optional[Set[str]] = None
+) -> Tuple[List[str], int]:
     """
     清理目录中的旧文件
 
     参数:
         directory: 要清理的目录
         max_age_days: 要保留的文件的最大年龄（天）
+        max_total_bytes: 目录中文件的总大小上限，超出时从最旧的文件开始删除（可选）
+        exclude: 不清理的文件名
 
     返回:
-        删除的文件路径列表
+        (删除的文件路径列表, 释放的字节数)
     """
-    import time
-
-    # 获取当前时间
     now = time.time()
-
-    # 用于存储删除的文件的列表
     removed_files = []
+    reclaimed = 0
 
     # 检查目录是否存在
     if not os.path.exists(directory):
-        return removed_files
-
-    # 遍历目录中的文件
-    for filename in os.listdir(directory):
-        file_path = os.path.join(directory, filename)
-
-        # 检查是否为文件（非目录）
-        if os.path.isfile(file_path):
-            # 获取文件修改时间
-            file_mod_time = os.path.getmtime(file_path)
-
-            # 计算天数
-            age_days = (now - file_mod_time) / (24 * 3600)
-
-            # 如果超过最大天数则删除
-            if age_days > max_age_days:
-                os.remove(file_path)
-                removed_files.append(file_path)
-
-    return removed_files
+        return removed_files, reclaimed
+
+    # os.scandir 一次遍历即可拿到文件类型，每个文件只需一次stat
+    files = []
+    with os.scandir(directory) as entries:
+        for entry in entries:
+            if (exclude and entry.name in exclude) or not entry.is_file(follow_symlinks=False):
+                continue
+            try:
+                stat = entry.stat(follow_symlinks=False)
+            except FileNotFoundError:
+                continue
+            files.append((stat.st_mtime, stat.st_size, entry.path))
+
+    # 按修改时间从旧到新处理，先删过期文件，再按总大小上限删除
+    files.sort()
+    total_bytes = sum(size for _, size, _ in files)
+    for mtime, size, path in files:
+        expired = (now - mtime) / (24 * 3600) > max_age_days
+        over_quota = max_total_bytes is not None and total_bytes > max_total_bytes
+        if not expired and not over_quota:
+            # 之后的文件更新，既未过期也无需为配额让位
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        else:
+            removed_files.append(path)
+            reclaimed += size
+        total_bytes -= size
+
+    return removed_files, reclaimed
@@ -1,14 +1,19 @@
 import json
 import os
+from typing import Optional
+
+import httpx
+from openai import DefaultAsyncHttpxClient
 from autogen_ext.models.openai import OpenAIChatCompletionClient
 
+MODEL_NAME = "qwen-vl-max-latest"
 
-def _setup_vllm_model_client():
+def _setup_vllm_model_client(http_client: httpx.AsyncClient = None, timeout: float = None, max_retries: int = None):
     """设置模型客户端"""
     api_key = os.getenv("DASHSCOPE_API_KEY", "sk-a95e9d6b446a409b8c9e8282a56361c2")
     if not api_key:
         raise ValueError("请在环境变量DASHSCOPE_API_KEY中配置有效的API Key")
-    model_config = {"model": "qwen-vl-max-latest", "api_key": api_key, "model_info": {
+    model_config = {"model": MODEL_NAME, "api_key": api_key, "model_info": {
         "vision": True,
         "function_calling": True,
         "json_output": True,
@@ -17,6 +22,61 @@ def _setup_vllm_model_client():
         "structured_output": True
     }, "base_url": "https://dashscope.aliyuncs.com/compatible-mode/v1"}
 
+    if http_client is not None:
+        model_config["http_client"] = http_client
+    if timeout is not None:
+        model_config["timeout"] = timeout
+    if max_retries is not None:
+        model_config["max_retries"] = max_retries
+
     return OpenAIChatCompletionClient(**model_config)
 
-model_client = _setup_vllm_model_client()
+
+class ModelClientManager:
+    """模型客户端生命周期管理
+
+    在应用启动时创建共享的模型客户端，底层HTTP连接池按上游服务的并发上限配置并保持长连接，
+    所有请求复用同一个客户端，应用关闭时统一释放连接。
+    """
+
+    def __init__(
+        self,
+        max_connections: int = None,
+        max_keepalive_connections: int = None,
+        keepalive_expiry: float = None,
+        timeout: float = None,
+        max_retries: int = None
+    ):
+        self.max_connections = max_connections or int(os.getenv("LLM_MAX_CONNECTIONS", "32"))
+        self.max_keepalive_connections = max_keepalive_connections or int(os.getenv("LLM_MAX_KEEPALIVE", "16"))
+        self.keepalive_expiry = keepalive_expiry or float(os.getenv("LLM_KEEPALIVE_EXPIRY", "60"))
+        self.timeout = timeout or float(os.getenv("LLM_TIMEOUT", "300"))
+        self.max_retries = max_retries if max_retries is not None else int(os.getenv("LLM_MAX_RETRIES", "2"))
+        self._client: Optional[OpenAIChatCompletionClient] = None
+
+    def start(self) -> OpenAIChatCompletionClient:
+        """创建共享的模型客户端，已创建时直接返回"""
+        if self._client is None:
+            http_client = DefaultAsyncHttpxClient(
+                limits=httpx.Limits(
+                    max_connections=self.max_connections,
+                    max_keepalive_connections=self.max_keepalive_connections,
+                    keepalive_expiry=self.keepalive_expiry
+                ),
+                timeout=httpx.Timeout(self.timeout, connect=10.0)
+            )
+            self._client = _setup_vllm_model_client(http_client, self.timeout, self.max_retries)
+        return self._client
+
+    @property
+    def client(self) -> OpenAIChatCompletionClient:
+        """共享的模型客户端，未经生命周期启动时（如脚本中直接调用）按需创建"""
+        return self.start()
+
+    async def aclose(self) -> None:
+        """关闭模型客户端及其连接池"""
+        if self._client is not None:
+            await self._client.close()
+            self._client = None
+
+model_client_manager = ModelClientManager()
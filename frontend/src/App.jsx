@@ -237,6 +237,10 @@ function App() {
   const [streamingOutput, setStreamingOutput] = useState('');
   const [testCases, setTestCases] = useState([]);
   const [excelUrl, setExcelUrl] = useState('');
+  // 服务端暂存的生成ID，导出时无需回传用例数据
+  const [generationId, setGenerationId] = useState('');
+  // 模型调用排队时前面的请求数，null表示未在排队
+  const [queuePosition, setQueuePosition] = useState(null);
   const [serverStatus, setServerStatus] = useState('checking');
 
   // 在组件加载时测试与后端的连接
@@ -277,6 +281,8 @@ function App() {
     setIsGenerating(true);
     setStreamingOutput('');
     setTestCases([]);
+    setGenerationId('');
+    setQueuePosition(null);
     try {
       const formData = new FormData();
       if (feishuUrl) {
@@ -300,6 +306,10 @@ function App() {
       const reader = response.body.getReader();
       const decoder = new TextDecoder();
       let buffer = '';
+      // 增量测试用例注释的扫描位置，后端每完成一个用例就会输出一条
+      const testCaseMarkerRegex = /<!-- TEST_CASE: (.+?) -->/g;
+      let markerScanPos = 0;
+      const streamedTestCases = [];
 
       console.log('开始读取流式响应...');
 
@@ -317,12 +327,45 @@ function App() {
         // 更新流式输出
         setStreamingOutput(prev => prev + chunk);
         console.log('收到数据块:', chunk);
+
+        // 排队期间后端定期推送排队位置，开始生成后不再推送
+        const queueMatches = [...chunk.matchAll(/<!-- QUEUE_POSITION: (\d+) -->/g)];
+        const chunkWithoutQueue = chunk.replace(/<!-- QUEUE_POSITION: \d+ -->\n?/g, '');
+        if (queueMatches.length > 0) {
+          setQueuePosition(Number(queueMatches[queueMatches.length - 1][1]));
+        }
+        if (chunkWithoutQueue.trim() && !chunkWithoutQueue.startsWith('# 正在生成测试用例')) {
+          setQueuePosition(null);
+        }
+
+        // 解析已完整到达的单个测试用例，生成过程中即可展示
+        testCaseMarkerRegex.lastIndex = markerScanPos;
+        let markerMatch;
+        let foundNewTestCase = false;
+        while ((markerMatch = testCaseMarkerRegex.exec(buffer)) !== null) {
+          markerScanPos = testCaseMarkerRegex.lastIndex;
+          try {
+            streamedTestCases.push(JSON.parse(markerMatch[1]));
+            foundNewTestCase = true;
+          } catch (jsonError) {
+            console.error('解析增量测试用例数据错误:', jsonError);
+          }
+        }
+        if (foundNewTestCase) {
+          setTestCases([...streamedTestCases]);
+        }
       }
 
       // 解析完整响应以获取测试用例
       console.log('开始解析测试用例...');
       console.log('完整的响应缓冲区:', buffer);
 
+      // 提取生成ID，用于直接从服务端导出
+      const generationIdMatch = buffer.match(/<!-- GENERATION_ID: (.+?) -->/);
+      if (generationIdMatch && generationIdMatch[1]) {
+        setGenerationId(generationIdMatch[1]);
+      }
+
       // 尝试从注释中提取结构化的测试用例数据
       const testCasesJsonRegex = /<!-- TEST_CASES_JSON: (.+?) -->/;
       const testCasesMatch = buffer.match(testCasesJsonRegex);
@@ -425,6 +468,7 @@ function App() {
       alert(`请求错误: ${error.message}\n请检查浏览器控制台以获取更多信息。`);
     } finally {
       setIsGenerating(false);
+      setQueuePosition(null);
     }
   };
 
@@ -435,13 +479,20 @@ function App() {
     }
 
     try {
-      const response = await fetch('http://localhost:8000/api/test-cases/export', {
-        method: 'POST',
-        headers: {
-          'Content-Type': 'application/json',
-        },
-        body: JSON.stringify(testCases),
-      });
+      // 优先按生成ID导出，生成结果过期时再回传用例数据
+      let response = null;
+      if (generationId) {
+        response = await fetch(`http://localhost:8000/api/test-cases/export/${generationId}?format=xlsx`);
+      }
+      if (!response || response.status === 404) {
+        response = await fetch('http://localhost:8000/api/test-cases/export', {
+          method: 'POST',
+          headers: {
+            'Content-Type': 'application/json',
+          },
+          body: JSON.stringify(testCases),
+        });
+      }
 
       if (response.ok) {
         // 从响应中获取blob
@@ -556,7 +607,8 @@ function App() {
                       {isGenerating ? '正在生成测试用例' : '测试用例结果'}
                     </Typography>
                     <Typography variant="body2" color="text.secondary">
-                      {isGenerating ? '请稍候，AI正在分析并生成测试用例...' : 
+                      {isGenerating && queuePosition !== null ? `排队中，前面还有 ${queuePosition} 个请求...` :
+                       isGenerating ? '请稍候，AI正在分析并生成测试用例...' : 
                        testCases.length > 0 ? `已生成 ${testCases.length} 个测试用例` : 
                        '上传图片或输入PRD文本开始生成'}
                     </Typography>
@@ -19,8 +19,16 @@ const StreamingOutput = ({ content }) => {
   const getDisplayContent = (rawContent) => {
     if (!rawContent) return '';
     
-    // 移除TEST_CASES_JSON注释
-    const filteredContent = rawContent.replace(/<!-- TEST_CASES_JSON: .+? -->/g, '');
+    // 生成中断续写时，丢弃最后一个检查点到续写标记之间未完成的用例
+    // 再移除TEST_CASES_JSON、增量TEST_CASE、GENERATION_ID、排队位置、Token用量及检查点注释
+    const filteredContent = rawContent
+      .replace(/<!-- CHECKPOINT -->\n(?:(?!<!-- CHECKPOINT -->)[\s\S])*?<!-- RESUME -->\n?/g, '')
+      .replace(/<!-- (?:CHECKPOINT|RESUME) -->\n?/g, '')
+      .replace(/<!-- TEST_CASES_JSON: .+? -->/g, '')
+      .replace(/<!-- TEST_CASE: .+? -->/g, '')
+      .replace(/<!-- GENERATION_ID: .+? -->/g, '')
+      .replace(/<!-- QUEUE_POSITION: \d+ -->\n?/g, '')
+      .replace(/<!-- TOKEN_USAGE: .+? -->\n?/g, '');
     
     return filteredContent;
   };